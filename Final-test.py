@@ -2,79 +2,98 @@
 # SMAC-Members-Inventory-Dashboard 
 # ==============================================
 
-import streamlit as st
-import pandas as pd
-import plotly.express as px
+import io
 import os
+import time
+
+import streamlit as st
+
+import smac_figures as figures
+import smac_perf as perf
+import smac_query as query
+import smac_startup as startup
+import smac_views as views
+from smac_aggregates import (ANOMALY_Z, RESAMPLE_FREQUENCIES, failed_files, failed_pairs, load_gas_pivot,
+                             load_monthly, load_monthly_anomalies, load_top_locations, load_year_changes, pivot_gases,
+                             rollup_gases)
+from smac_data import DATA_FOLDER, GAS_LABELS, country_name_map, data_cache, sector_map
+from smac_manifest import current_manifest, manifest_countries, manifest_pairs, manifest_years
+
+# Cold start (once per process): the default view's figures come from the snapshot
+# ingest writes, and the data every tab shares is loaded in the background meanwhile
+startup.start(DATA_FOLDER)
 
 # ----------------------------------------------
 # Setup: Define constants & helper functions
 # ----------------------------------------------
 
-DATA_FOLDER = "data"
-country_name_map = {
-    "ARG": "Argentina", "BRA": "Brazil", "CAN": "Canada", "DEU": "Germany",
-    "ESP": "Spain", "IND": "India", "KOR": "South Korea", "MEX": "Mexico",
-    "NGA": "Nigeria", "USA": "United States", "ZAF": "South Africa"
-}
-SMAC_COUNTRIES_FULL = [v for v in country_name_map.values()]
-SMAC_COUNTRIES = list(country_name_map.keys())  # ← 新加的
-
-AVAILABLE_YEARS = [2021, 2022, 2023, 2024]
-
-def load_country_year_data(country_code, year):
-    file_name = f"{country_code}_{year}.csv"
-    file_path = os.path.join(DATA_FOLDER, file_name)
-    try:
-        df = pd.read_csv(file_path)
-        return df
-    except FileNotFoundError:
-        st.warning(f"Data file not found for {country_code} {year}. Please check your folder.")
-        return pd.DataFrame()
-
-country_centroids = {
-    "ARG": {"Country": "Argentina", "Lat": -38.4, "Lon": -63.6},
-    "BRA": {"Country": "Brazil", "Lat": -14.2, "Lon": -51.9},
-    "CAN": {"Country": "Canada", "Lat": 56.1, "Lon": -106.3},
-    "DEU": {"Country": "Germany", "Lat": 51.2, "Lon": 10.5},
-    "ESP": {"Country": "Spain", "Lat": 40.5, "Lon": -3.7},
-    "IND": {"Country": "India", "Lat": 21.1, "Lon": 78.0},
-    "KOR": {"Country": "South Korea", "Lat": 36.5, "Lon": 127.9},
-    "MEX": {"Country": "Mexico", "Lat": 23.6, "Lon": -102.5},
-    "NGA": {"Country": "Nigeria", "Lat": 9.1, "Lon": 8.7},
-    "USA": {"Country": "United States", "Lat": 37.1, "Lon": -95.7},
-    "ZAF": {"Country": "South Africa", "Lat": -30.6, "Lon": 22.9},
-}
-
-# Sector mapping
-sector_map = {
-    "electricity-generation": "power", "solid-fuel-transformation": "power",
-    "heat-plants": "power", "cement": "manufacturing", "chemicals": "manufacturing",
-    "aluminum": "manufacturing", "iron-and-steel": "manufacturing", "glass": "manufacturing",
-    "lime": "manufacturing", "food-beverage-tobacco": "manufacturing", "wood-and-wood-products": "manufacturing",
-    "pulp-and-paper": "manufacturing", "textiles-leather-apparel": "manufacturing", "other-manufacturing": "manufacturing",
-    "petrochemical-steam-cracking": "manufacturing", "other-chemicals": "manufacturing", "other-metals": "manufacturing",
-    "road-transportation": "transportation", "domestic-aviation": "transportation", "international-aviation": "transportation",
-    "railways": "transportation", "other-transport": "transportation", "domestic-shipping": "transportation",
-    "international-shipping": "transportation", "crop-residues": "agriculture", "cropland-fires": "agriculture",
-    "rice-cultivation": "agriculture", "synthetic-fertilizer-application": "agriculture", "other-agricultural-soil-emissions": "agriculture",
-    "enteric-fermentation-cattle-pasture": "agriculture", "enteric-fermentation-cattle-operation": "agriculture",
-    "enteric-fermentation-other": "agriculture", "manure-left-on-pasture-cattle": "agriculture",
-    "manure-management-cattle-operation": "agriculture", "manure-management-other": "agriculture",
-    "manure-applied-to-soils": "agriculture", "coal-mining": "fossil-fuel-operations", "oil-and-gas-production": "fossil-fuel-operations",
-    "oil-and-gas-transport": "fossil-fuel-operations", "oil-and-gas-refining": "fossil-fuel-operations",
-    "other-fossil-fuel-operations": "fossil-fuel-operations", "solid-waste-disposal": "waste",
-    "biological-treatment-of-solid-waste-and-biogenic": "waste", "incineration-and-open-burning-of-waste": "waste",
-    "domestic-wastewater-treatment-and-discharge": "waste", "industrial-wastewater-treatment-and-discharge": "waste",
-    "forest-land-clearing": "land-use-change", "forest-land-degradation": "land-use-change", "forest-land-fires": "land-use-change",
-    "net-forest-land": "land-use-change", "net-shrubgrass": "land-use-change", "net-wetland": "land-use-change",
-    "wetland-fires": "land-use-change", "shrubgrass-fires": "land-use-change", "removals": "land-use-change",
-    "water-reservoirs": "land-use-change", "bauxite-mining": "mineral-extraction", "copper-mining": "mineral-extraction",
-    "iron-mining": "mineral-extraction", "sand-quarrying": "mineral-extraction", "rock-quarrying": "mineral-extraction",
-    "other-mining-quarrying": "mineral-extraction", "fluorinated-gases": "fluorinated-gases",
-    "residential-onsite-fuel-usage": "other-energy-use", "non-residential-onsite-fuel-usage": "other-energy-use",
-    "other-onsite-fuel-usage": "other-energy-use", "other-energy-use": "other-energy-use"
-}
+# Countries and years come from the data manifest: whatever {ISO3}_{YEAR}.csv files are
+# in DATA_FOLDER, including ones dropped in since the last ingest
+manifest = current_manifest(DATA_FOLDER)
+SMAC_COUNTRIES = [c for c in country_name_map if c in manifest_countries(manifest)]
+SMAC_COUNTRIES_FULL = [country_name_map[c] for c in SMAC_COUNTRIES]
+
+AVAILABLE_YEARS = manifest_years(manifest)
+YEAR_SPAN = f"{AVAILABLE_YEARS[0]}–{AVAILABLE_YEARS[-1]}" if AVAILABLE_YEARS else ""
+COMPARE_PANELS = "ABCD"  # Comparison Tool: up to four locations side by side
+PREVIEW_ROWS = 1000      # Explore & export: rows shown before downloading
+
+def available_country_years(pairs):
+    # Warn about (country, year) files that are missing, return the ones on disk; files that
+    # could not be read are left out too (the warning at the top names them)
+    on_disk = manifest_pairs(manifest)
+    unreadable = failed_pairs(DATA_FOLDER)
+    available = []
+    for country_code, year in pairs:
+        if (country_code, year) in unreadable:
+            continue
+        if (country_code, year) in on_disk:
+            available.append((country_code, year))
+        else:
+            st.warning(f"Data file not found for {country_code} {year}. Please check your folder.")
+    return available
+
+def plotly_chart(fig, **kwargs):
+    # st.plotly_chart, timed with its payload size while diagnostics are recorded
+    if perf_run is None:
+        st.plotly_chart(fig, use_container_width=True, **kwargs)
+        return
+    start = time.perf_counter()
+    st.plotly_chart(fig, use_container_width=True, **kwargs)
+    # Payload size from the JSON the figure cache already serialized, not a second to_json()
+    size = figures.payload_bytes(fig)
+    perf_run.add("serialize", fig.layout.title.text, (time.perf_counter() - start) * 1000,
+                 kb=None if size is None else round(size / 1024, 1))
+
+def gas_selectbox(key, gases):
+    # Gas picker, CH₄ first; switching gas only changes which pivot column is read
+    return st.selectbox("Select Gas", gases, format_func=GAS_LABELS.get, key=key)
+
+def ch4_share_metric(pivot, **filters):
+    # CH₄'s share of CO₂e, on the 100-year basis when the files carry it, else 20-year
+    for horizon in ('100yr', '20yr'):
+        share = views.ch4_share(pivot, horizon, **filters)
+        if share is not None:
+            st.metric(f"CH₄ share of {GAS_LABELS['co2e_' + horizon]}", f"{share:.1%}")
+            return
+
+def export_download(location_match, filters):
+    # Called only when the download is clicked. Streamlit holds the whole file in
+    # memory to serve it, so the CSV is written there directly, one chunk of
+    # database rows at a time and never as a DataFrame
+    data = io.BytesIO()
+    for text in query.iter_csv(location_match=location_match, **filters):
+        data.write(text.encode("utf-8"))
+    return data
+
+def top_n_controls(key, sectors):
+    # How many locations to rank, and over all sectors or just one
+    col_n, col_sector = st.columns([1, 3])
+    with col_n:
+        n = st.number_input("Top N", min_value=1, max_value=100, value=10, step=1, key=f'{key}_n')
+    with col_sector:
+        sector = st.selectbox("Rank by sector", ["All sectors"] + sectors, key=f'{key}_sector')
+    return int(n), None if sector == "All sectors" else sector
 
 st.set_page_config(layout="wide")
 st.title("SMAC Members Methane Inventory")
@@ -89,392 +108,394 @@ While every effort is made to ensure accuracy, the data is provided as-is and ma
 [https://observablehq.com/@max-no-sekai/smac-methane-emissions-sunburst-tool](https://observablehq.com/@max-no-sekai/smac-methane-emissions-sunburst-tool)
 """)
 
+if not SMAC_COUNTRIES:
+    st.error(f"No {{ISO3}}_{{YEAR}}.csv files for SMAC members found in '{DATA_FOLDER}'.")
+    st.stop()
+
 
 # ----------------------------------------------
-# Tabs: Global View (Tab 1) | SMAC Group (Tab 2) | Comparison (Tab 3)
+# Tabs: Global View (Tab 1) | SMAC Group (Tab 2) | Comparison (Tab 3) | Monthly Trends (Tab 4) | Changes (Tab 5) | Explore (Tab 6)
 # ----------------------------------------------
 
 st.markdown("---")
 tab_selection = st.radio(
         "",  
-        options=["🌎 SMAC Group Overview", "SMAC Member Methane Emissions", "Comparison Tool"],
+        options=["🌎 SMAC Group Overview", "SMAC Member Methane Emissions", "Comparison Tool", "📈 Monthly Trends",
+                 "🔺 Changes & Anomalies", "🔎 Explore & export"],
         horizontal=True,
     )
 st.markdown("---")
+# Files that could not be read are listed here once a tab has tried to load them
+file_problems = st.container()
 
+# Diagnostics: ?perf=1 or SMAC_PERF=1 shows the panel, SMAC_PERF_LOG also records to a file
+show_perf_panel = perf.PERF_ENABLED or st.query_params.get("perf") == "1"
+perf_run = perf.start_run(tab_selection) if show_perf_panel or perf.PERF_LOG else None
 
-# ========== TAB 1: SMAC Group Overview – CH₄ Emissions ==========
-
-if tab_selection == "🌎 SMAC Group Overview":
- 
-    st.header("🌍 SMAC Group Overview – CH₄ Emissions")
-  
-    selected_year_tab1 = st.selectbox("Select Year", AVAILABLE_YEARS, key='tab1_year')
-
-    # Combine all country data for the selected year
-    combined_df = pd.DataFrame()
-    for country in SMAC_COUNTRIES:
-        temp_df = load_country_year_data(country, selected_year_tab1)
-        if not temp_df.empty:
-            temp_df['country'] = country
-            combined_df = pd.concat([combined_df, temp_df], ignore_index=True)
-
-    if not combined_df.empty:
-        df_ch4_group = combined_df[combined_df['gas'] == 'ch4']
-
-        # Aggregate by country
-        country_emissions = (
-            df_ch4_group.groupby('country')['total_emission']
-            .sum()
-            .reset_index()
-            .sort_values(by='total_emission', ascending=False)
-        )
-        country_emissions['Country Full Name'] = country_emissions['country'].map(country_name_map)
-
-        # Add centroid coordinates for real map style
-        country_emissions["Lat"] = country_emissions["country"].apply(lambda x: country_centroids[x]["Lat"])
-        country_emissions["Lon"] = country_emissions["country"].apply(lambda x: country_centroids[x]["Lon"])
-
-        # Real Map Style (Mapbox) + Ranking Table (side by side)
-        col_map, col_rank = st.columns([3, 1])
-
-        with col_map:
-            st.subheader(f"SMAC GROUP CH₄ Emissions Map  – {selected_year_tab1}")
-
-            fig_mapbox = px.scatter_mapbox(
-                country_emissions,
-                lat="Lat",
-                lon="Lon",
-                size="total_emission",
-                color="total_emission",
-                hover_name="Country Full Name",
-                size_max=50,
-                zoom=1,
-                color_continuous_scale=px.colors.sequential.Viridis,
-                labels={'total_emission': 'CH₄ Emissions'},
-                title=f"CH₄ Emissions by Country ({selected_year_tab1})"
-            )
-            fig_mapbox.update_traces(
-                hovertemplate=
-            "<b>%{hovertext}</b><br>" +
-            "CH₄ Emissions: %{marker.size:.2f}<br>" +
-            "Lat: %{lat}<br>" +
-            "Lon: %{lon}<extra></extra>")
-
-            fig_mapbox.update_layout(
-                mapbox_style="carto-positron",
-                margin={"r":0, "t":30, "l":0, "b":0}
-            )
+try:
+    # Lighter chart payloads for slow connections: ?lite=1 or SMAC_TRIM_PAYLOAD=1
+    figures.set_trim(figures.TRIM_PAYLOAD or st.query_params.get("lite") == "1")
 
-            st.plotly_chart(fig_mapbox, use_container_width=True)
-
-        with col_rank:
-            st.subheader("CH₄ Emissions Ranking")
-            country_emissions_rank = country_emissions.copy()
-            country_emissions_rank['Rank'] = range(1, len(country_emissions_rank) + 1)
-            country_emissions_rank = country_emissions_rank[['Rank', 'Country Full Name', 'total_emission']]
-            country_emissions_rank.columns = ['Rank', 'Country', 'CH₄ Emissions']
-            st.dataframe(country_emissions_rank, hide_index=True, use_container_width=True)
-
-        # 2️⃣ Full-width: Sector Emissions Over Time (2021–2024)
-        st.subheader("SMAC Group CH₄ Emissions by Sector (2021–2024)")
-
-        combined_all_years = pd.DataFrame()
-        for year in AVAILABLE_YEARS:
-            for country in SMAC_COUNTRIES:
-                temp_df = load_country_year_data(country, year)
-                if not temp_df.empty:
-                    temp_df['year'] = year
-                    temp_df['country'] = country
-                    combined_all_years = pd.concat([combined_all_years, temp_df], ignore_index=True)
-
-        if not combined_all_years.empty:
-            df_ch4_all = combined_all_years[combined_all_years['gas'] == 'ch4'].copy()
-            df_ch4_all['sector'] = df_ch4_all['original_inventory_sector'].map(sector_map).fillna('other')
-
-            sector_time_df = (
-                df_ch4_all.groupby(['year', 'sector'])['total_emission']
-                .sum()
-                .reset_index()
-            )
+    # ========== TAB 1: SMAC Group Overview – Emissions by Gas ==========
 
-            fig_sector_over_time = px.bar(
-                sector_time_df,
-                x='year',
-                y='total_emission',
-                color='sector',
-                labels={'total_emission': 'CH₄ Emissions', 'year': 'Year'},
-                title="CH₄ Emissions by Sector Over Time"
-            )
-            st.plotly_chart(fig_sector_over_time, use_container_width=True)
-
-        # 3️⃣ Full-width: Country Share Pie Chart
-        st.subheader(f"Country Share of Total CH₄ Emissions ({selected_year_tab1})")
-
-        fig_country_pie = px.pie(
-            country_emissions,
-            names='Country Full Name',
-            values='total_emission',
-            title=f"Country Share of Total CH₄ Emissions ({selected_year_tab1})"
-        )
-        st.plotly_chart(fig_country_pie, use_container_width=True)
-
-        # 4️⃣ Full-width: Top 10 Emitting Locations Across SMAC Group
-        st.subheader(f"Top 10 Emitting Locations Across SMAC Group ({selected_year_tab1})")
-
-        top_locations_group = (
-            df_ch4_group.groupby(['location', 'country'])['total_emission']
-            .sum()
-            .reset_index()
-            .sort_values(by='total_emission', ascending=False)
-            .head(10)
-        )
-        top_locations_group['Country Full Name'] = top_locations_group['country'].map(country_name_map)
-
-        fig_top_locations = px.bar(
-            top_locations_group,
-            x='location',
-            y='total_emission',
-            color='Country Full Name',
-            title=f"Top 10 Emitting Locations ({selected_year_tab1})",
-            labels={'total_emission': 'CH₄ Emissions', 'location': 'Location'}
-        )
-        st.plotly_chart(fig_top_locations, use_container_width=True)
-
-
-# ========== TAB 2: SMAC Group Methane Emissions ==========
-elif tab_selection == "SMAC Member Methane Emissions":
-    country_full = st.selectbox("Select a Country", SMAC_COUNTRIES_FULL, key='tab2_country')
-    year = st.selectbox("Select a Year", AVAILABLE_YEARS, key='tab2_year')
-
-    country_code = [k for k, v in country_name_map.items() if v == country_full][0]
-
-    st.header(f"{country_full} ({year}) Methane Emissions")
-
-    df = load_country_year_data(country_code, year)
-
-    if not df.empty:
-        df_ch4 = df[df['gas'] == 'ch4']
-
-        # Sector Breakdown 
-        st.subheader(f"{country_full} ({year}) – CH₄ Emissions by Sector")
-        sector_df = df_ch4.groupby('original_inventory_sector')['total_emission'].sum().reset_index()
-        sector_df['sector'] = sector_df['original_inventory_sector'].map(sector_map).fillna('other')
-        sector_grouped = sector_df.groupby('sector')['total_emission'].sum().reset_index()
-
-        fig_sector = px.bar(
-            sector_grouped.sort_values(by='total_emission', ascending=False),
-            x='sector',
-            y='total_emission',
-            labels={'total_emission': 'Emissions (CH₄)'},
-            title="Sector Breakdown"
-        )
-        st.plotly_chart(fig_sector, use_container_width=True)
-
-        # Pie Chart
-        st.subheader(f"{country_full} ({year}) – Subsector Breakdown (CH₄)")
-        fig_subsector = px.pie(sector_df, names='original_inventory_sector', values='total_emission',
-                               title="Subsector Breakdown Pie Chart")
-        fig_subsector.update_traces(
-            textinfo='none',
-            pull=[0.05]*len(sector_df),
-            insidetextorientation='radial'
-        )
-        fig_subsector.update_layout(
-            uniformtext_minsize=10,
-            uniformtext_mode='hide',
-            legend=dict(font=dict(size=10)),
-            showlegend=True
-        )
-        st.plotly_chart(fig_subsector, use_container_width=True)
-
-        # Top 10 Locations Table
-        st.subheader(f"Top 10 Locations for CH₄ Emissions – {country_full} ({year})")
-        top_locations = (
-            df_ch4.groupby('location')['total_emission']
-            .sum()
-            .reset_index()
-            .sort_values(by='total_emission', ascending=False)
-            .head(10)
-        )
-        top_locations = top_locations.reset_index(drop=True)
-        top_locations['Rank'] = top_locations.index + 1
-        top_locations['CH₄ Emissions'] = top_locations['total_emission'].apply(lambda x: f"{x:.3f}")
-        top_locations = top_locations[['Rank', 'location', 'CH₄ Emissions']]
-        st.dataframe(top_locations, hide_index=True)
-
-        # NEW: Add 2021–2024 Trend Chart for This Country
-        st.subheader(f"{country_full} – CH₄ Emissions Trend (2021–2024)")
-        
-        combined_country_years = pd.DataFrame()
-        for year_iter in AVAILABLE_YEARS:
-            df_temp = load_country_year_data(country_code, year_iter)
-            if not df_temp.empty:
-                df_temp['year'] = year_iter
-                combined_country_years = pd.concat([combined_country_years, df_temp], ignore_index=True)
-                
-        if not combined_country_years.empty:
-            df_ch4_all = combined_country_years[combined_country_years['gas'] == 'ch4'].copy()
-            df_ch4_all['sector'] = df_ch4_all['original_inventory_sector'].map(sector_map).fillna('other')
-            
-            sector_time_df = (
-                df_ch4_all.groupby(['year', 'sector'])['total_emission']
-                .sum()
-                .reset_index())
-            
-            fig_trend = px.bar(
-                sector_time_df,
-                x='year', 
-                y='total_emission',
-                color='sector',
-                labels={'total_emission': 'CH₄ Emissions', 'year': 'Year'},
-                title=f"{country_full} CH₄ Emissions by Sector (2021–2024)")
-            st.plotly_chart(fig_trend, use_container_width=True)
-
-
-# ========== TAB 3: Comparison Tool ==========
-elif tab_selection == "Comparison Tool":
-   
-    st.header("Compare CH₄ Emissions")
-
-    # Side-by-side selectors for A and B
-    col1, col2 = st.columns(2)
-    with col1:
-        st.subheader("Location A")
-        country_a_full = st.selectbox("Country A", SMAC_COUNTRIES_FULL, key='a')
-        year_a = st.selectbox("Year A", AVAILABLE_YEARS, key='year_a')
-        country_a = [k for k, v in country_name_map.items() if v == country_a_full][0]
-        df_a = load_country_year_data(country_a, year_a)
-
-    with col2:
-        st.subheader("Location B")
-        country_b_full = st.selectbox("Country B", SMAC_COUNTRIES_FULL, key='b')
-        year_b = st.selectbox("Year B", AVAILABLE_YEARS, key='year_b')
-        country_b = [k for k, v in country_name_map.items() if v == country_b_full][0]
-        df_b = load_country_year_data(country_b, year_b)
-
-    # Side-by-side plots and tables for A and B
-    col3, col4 = st.columns(2)
-    with col3:
-        if not df_a.empty:
-            st.subheader(f"{country_a_full} ({year_a}) – Sector Breakdown")
-            df_ch4_a = df_a[df_a['gas'] == 'ch4']
-            sector_df_a = df_ch4_a.groupby('original_inventory_sector')['total_emission'].sum().reset_index()
-            sector_df_a['sector'] = sector_df_a['original_inventory_sector'].map(sector_map).fillna('other')
-
-            # Bar Chart
-            fig_a = px.bar(sector_df_a.sort_values(by='total_emission', ascending=False),
-                           x='sector', y='total_emission',
-                           title=f"{country_a_full} – CH₄ Emissions by Sector")
-            st.plotly_chart(fig_a, use_container_width=True, key='fig_a_bar')
+    if tab_selection == "🌎 SMAC Group Overview":
 
-            # Pie Chart
-            fig_pie_a = px.pie(sector_df_a, names='original_inventory_sector', values='total_emission',
-                               title=f"{country_a_full} – CH₄ Emissions by Subsector")
-            fig_pie_a.update_traces(
-                textinfo='none',
-                pull=[0.05]*len(sector_df_a),
-                insidetextorientation='radial'
-            )
-            fig_pie_a.update_layout(
-                uniformtext_minsize=10,
-                uniformtext_mode='hide',
-                legend=dict(font=dict(size=10)),
-                showlegend=True
-            )
-            st.plotly_chart(fig_pie_a, use_container_width=True, key='fig_a_pie')
-
-            # Data Table
-            st.subheader("Data Table – Location A")
-            st.dataframe(sector_df_a)
-
-            #  NEW: Add 2021–2024 Trend Chart for Location A
-            st.subheader(f"{country_a_full} – CH₄ Emissions Trend (2021–2024)")
-            
-            combined_a_years = pd.DataFrame()
-            for year_iter in AVAILABLE_YEARS:
-                df_temp_a = load_country_year_data(country_a, year_iter)
-                if not df_temp_a.empty:
-                    df_temp_a['year'] = year_iter
-                    combined_a_years = pd.concat([combined_a_years, df_temp_a], ignore_index=True)
-                    
-            if not combined_a_years.empty:
-                df_ch4_all_a = combined_a_years[combined_a_years['gas'] == 'ch4'].copy()
-                df_ch4_all_a['sector'] = df_ch4_all_a['original_inventory_sector'].map(sector_map).fillna('other')
-                
-                sector_time_df_a = (
-                    df_ch4_all_a.groupby(['year', 'sector'])['total_emission']
-                    .sum()
-                    .reset_index())
-                
-                fig_trend_a = px.bar(
-                    sector_time_df_a,
-                    x='year',
-                    y='total_emission',
-                    color='sector',
-                    labels={'total_emission': 'CH₄ Emissions', 'year': 'Year'},
-                    title=f"{country_a_full} CH₄ Emissions by Sector (2021–2024)")
-                st.plotly_chart(fig_trend_a, use_container_width=True, key='fig_trend_a')
-
-
-    with col4:
-        if not df_b.empty:
-            st.subheader(f"{country_b_full} ({year_b}) – Sector Breakdown")
-            df_ch4_b = df_b[df_b['gas'] == 'ch4']
-            sector_df_b = df_ch4_b.groupby('original_inventory_sector')['total_emission'].sum().reset_index()
-            sector_df_b['sector'] = sector_df_b['original_inventory_sector'].map(sector_map).fillna('other')
-
-            # Bar Chart
-            fig_b = px.bar(sector_df_b.sort_values(by='total_emission', ascending=False),
-                           x='sector', y='total_emission',
-                           title=f"{country_b_full} – CH₄ Emissions by Sector")
-            st.plotly_chart(fig_b, use_container_width=True, key='fig_b_bar')
+        # Country × year × sector × subsector × location totals with one column per gas, shared by all
+        # sessions; loaded by the tabs that chart it, so the others don't depend on it
+        pivot = load_gas_pivot(DATA_FOLDER)
+
+        selected_year_tab1 = st.selectbox("Select Year", AVAILABLE_YEARS, index=len(AVAILABLE_YEARS) - 1, key='tab1_year')
+        gas_tab1 = gas_selectbox('tab1_gas', pivot_gases(pivot))
+        label_tab1 = GAS_LABELS[gas_tab1]
+
+        st.header(f"🌍 SMAC Group Overview – {label_tab1} Emissions")
+
+        # All country data for the selected year
+        countries_tab1 = [c for c, _ in available_country_years(
+            [(country, selected_year_tab1) for country in SMAC_COUNTRIES])]
+
+        if countries_tab1:
+            # Aggregate by country, with centroid coordinates for real map style
+            country_emissions = views.country_totals(pivot, countries_tab1, selected_year_tab1, gas_tab1)
+
+            # Real Map Style (Mapbox) + Ranking Table (side by side)
+            col_map, col_rank = st.columns([3, 1])
+
+            with col_map:
+                st.subheader(f"SMAC GROUP {label_tab1} Emissions Map  – {selected_year_tab1}")
+                fig_mapbox = views.fig_country_map(country_emissions, selected_year_tab1, gas_tab1)
+                plotly_chart(fig_mapbox)
+
+            with col_rank:
+                st.subheader(f"{label_tab1} Emissions Ranking")
+                country_emissions_rank = views.country_ranking(country_emissions, gas_tab1)
+                st.dataframe(country_emissions_rank, hide_index=True, use_container_width=True)
+                ch4_share_metric(pivot, country=countries_tab1, year=selected_year_tab1)
+
+            # 2️⃣ Full-width: Sector Emissions Over Time (all years)
+            st.subheader(f"SMAC Group {label_tab1} Emissions by Sector ({YEAR_SPAN})")
+
+            pairs_all_years = available_country_years(
+                [(country, year) for year in AVAILABLE_YEARS for country in SMAC_COUNTRIES])
+
+            if pairs_all_years:
+                sector_time_df = views.sector_trend(
+                    pivot, sorted({c for c, _ in pairs_all_years}), sorted({y for _, y in pairs_all_years}), gas_tab1)
+                fig_sector_over_time = views.fig_sector_trend(
+                    sector_time_df, f"{label_tab1} Emissions by Sector Over Time", gas_tab1)
+                plotly_chart(fig_sector_over_time)
+
+            # 3️⃣ Full-width: Country Share Pie Chart
+            st.subheader(f"Country Share of Total {label_tab1} Emissions ({selected_year_tab1})")
+
+            fig_country_pie = views.fig_country_pie(country_emissions, selected_year_tab1, gas_tab1)
+            plotly_chart(fig_country_pie)
+
+            # 4️⃣ Full-width: Top N Emitting Locations Across SMAC Group
+            top_index = load_top_locations(DATA_FOLDER)
+            top_n_tab1, top_sector_tab1 = top_n_controls('tab1_top', top_index.sectors)
+            st.subheader(f"Top {top_n_tab1} Emitting Locations Across SMAC Group ({selected_year_tab1})"
+                         + (f" – {top_sector_tab1}" if top_sector_tab1 else ""))
+
+            top_locations_group = views.top_locations_group(
+                top_index, countries_tab1, selected_year_tab1, top_n_tab1, gas_tab1, top_sector_tab1)
+            fig_top_locations = views.fig_top_locations(top_locations_group, selected_year_tab1, gas_tab1, top_n_tab1)
+            plotly_chart(fig_top_locations)
+
+
+    # ========== TAB 2: SMAC Group Methane Emissions ==========
+    elif tab_selection == "SMAC Member Methane Emissions":
+        pivot = load_gas_pivot(DATA_FOLDER)
+        country_full = st.selectbox("Select a Country", SMAC_COUNTRIES_FULL, key='tab2_country')
+        year = st.selectbox("Select a Year", AVAILABLE_YEARS, key='tab2_year')
+        gas_tab2 = gas_selectbox('tab2_gas', pivot_gases(pivot))
+        label_tab2 = GAS_LABELS[gas_tab2]
+
+        country_code = [k for k, v in country_name_map.items() if v == country_full][0]
+
+        st.header(f"{country_full} ({year}) {label_tab2} Emissions")
+
+        if available_country_years([(country_code, year)]):
+            ch4_share_metric(pivot, country=country_code, year=year)
+
+            # Sector Breakdown 
+            st.subheader(f"{country_full} ({year}) – {label_tab2} Emissions by Sector")
+            sector_df = views.subsector_totals(pivot, country_code, year, gas_tab2)
+            sector_grouped = views.sector_totals(sector_df)
+
+            fig_sector = views.fig_sector_bar(sector_grouped, "Sector Breakdown",
+                                              labels={'total_emission': f'Emissions ({label_tab2})'})
+            plotly_chart(fig_sector)
 
             # Pie Chart
-            fig_pie_b = px.pie(sector_df_b, names='original_inventory_sector', values='total_emission',
-                               title=f"{country_b_full} – CH₄ Emissions by Subsector")
-            fig_pie_b.update_traces(
-                textinfo='none',
-                pull=[0.05]*len(sector_df_b),
-                insidetextorientation='radial'
+            st.subheader(f"{country_full} ({year}) – Subsector Breakdown ({label_tab2})")
+            fig_subsector = views.fig_subsector_pie(sector_df, "Subsector Breakdown Pie Chart")
+            plotly_chart(fig_subsector)
+
+            # Top N Locations Table
+            top_index = load_top_locations(DATA_FOLDER)
+            top_n_tab2, top_sector_tab2 = top_n_controls('tab2_top', top_index.sectors)
+            st.subheader(f"Top {top_n_tab2} Locations for {label_tab2} Emissions – {country_full} ({year})"
+                         + (f" – {top_sector_tab2}" if top_sector_tab2 else ""))
+            top_locations = views.top_locations_table(
+                top_index, country_code, year, top_n_tab2, gas_tab2, top_sector_tab2)
+            st.dataframe(top_locations, hide_index=True)
+
+            # NEW: Add all-years Trend Chart for This Country
+            st.subheader(f"{country_full} – {label_tab2} Emissions Trend ({YEAR_SPAN})")
+
+            years_country = [y for _, y in available_country_years(
+                [(country_code, year_iter) for year_iter in AVAILABLE_YEARS])]
+
+            if years_country:
+                sector_time_df = views.sector_trend(pivot, country_code, years_country, gas_tab2)
+                fig_trend = views.fig_sector_trend(
+                    sector_time_df, f"{country_full} {label_tab2} Emissions by Sector ({YEAR_SPAN})", gas_tab2)
+                plotly_chart(fig_trend)
+
+
+    # ========== TAB 3: Comparison Tool ==========
+    elif tab_selection == "Comparison Tool":
+
+        pivot = load_gas_pivot(DATA_FOLDER)
+        gas_cmp = gas_selectbox('cmp_gas', pivot_gases(pivot))
+        label_cmp = GAS_LABELS[gas_cmp]
+
+        st.header(f"Compare {label_cmp} Emissions")
+
+        # Side-by-side selectors, one column per location (A, B, ...)
+        n_panels = int(st.number_input("Locations to compare", min_value=2, max_value=len(COMPARE_PANELS),
+                                       value=2, step=1, key='cmp_panels'))
+        panels = []
+        for letter, col in zip(COMPARE_PANELS, st.columns(n_panels)):
+            with col:
+                st.subheader(f"Location {letter}")
+                panel_country_full = st.selectbox(f"Country {letter}", SMAC_COUNTRIES_FULL, key=letter.lower())
+                panel_year = st.selectbox(f"Year {letter}", AVAILABLE_YEARS, key=f'year_{letter.lower()}')
+                panel_country = [k for k, v in country_name_map.items() if v == panel_country_full][0]
+                has_panel = bool(available_country_years([(panel_country, panel_year)]))
+                panels.append((letter, panel_country_full, panel_country, panel_year, has_panel))
+
+        # Each distinct (country, year) is computed once and memoized across reruns and sessions
+        distinct = {(c, y) for _, _, c, y, has_panel in panels if has_panel}
+        if len(distinct) < n_panels:
+            st.caption(f"{n_panels} panels, {len(distinct)} distinct selections")
+
+        # Side-by-side plots and tables, one column per location
+        for (letter, panel_country_full, panel_country, panel_year, has_panel), col in zip(panels, st.columns(n_panels)):
+            with col:
+                if not has_panel:
+                    continue
+                key = letter.lower()
+                st.subheader(f"{panel_country_full} ({panel_year}) – Sector Breakdown")
+                years_panel = [y for _, y in available_country_years(
+                    [(panel_country, year_iter) for year_iter in AVAILABLE_YEARS])]
+                sector_df, _, sector_time_df = views.comparison_summary(
+                    pivot, panel_country, panel_year, years_panel, gas_cmp)
+                fig_bar, fig_pie, fig_trend = views.comparison_figures(
+                    pivot, panel_country, panel_year, years_panel, gas_cmp)
+                ch4_share_metric(pivot, country=panel_country, year=panel_year)
+
+                # Bar Chart
+                plotly_chart(fig_bar, key=f'fig_{key}_bar')
+
+                # Pie Chart
+                plotly_chart(fig_pie, key=f'fig_{key}_pie')
+
+                # Data Table
+                st.subheader(f"Data Table – Location {letter}")
+                st.dataframe(sector_df)
+
+                # All-years Trend Chart for this location
+                st.subheader(f"{panel_country_full} – {label_cmp} Emissions Trend ({YEAR_SPAN})")
+                if years_panel:
+                    plotly_chart(fig_trend, key=f'fig_trend_{key}')
+
+
+    # ========== TAB 4: Monthly Trends ==========
+    elif tab_selection == "📈 Monthly Trends":
+
+        # Country × month × gas × sector × location rollup, loaded only for this tab
+        monthly = load_monthly(DATA_FOLDER)
+
+        gas_m = gas_selectbox('tab4_gas', rollup_gases(monthly))
+        label_m = GAS_LABELS[gas_m]
+
+        st.header(f"Monthly {label_m} Emissions Trends")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            country_m_full = st.selectbox("Country", SMAC_COUNTRIES_FULL, key='tab4_country')
+            country_m = [k for k, v in country_name_map.items() if v == country_m_full][0]
+        sectors_m, locations_m = views.monthly_options(monthly, country_m, gas_m)
+        with col2:
+            sector_m = st.selectbox("Sector", ["All sectors"] + sectors_m, key='tab4_sector')
+        with col3:
+            location_m = st.selectbox("Location", ["All locations"] + locations_m, key='tab4_location')
+
+        col4, col5 = st.columns(2)
+        with col4:
+            frequency_m = st.radio("Resolution", list(RESAMPLE_FREQUENCIES), horizontal=True, key='tab4_freq')
+        with col5:
+            split_m = st.radio("Split by", ["None", "Sector", "Location"], horizontal=True, key='tab4_split')
+
+        if not sectors_m:
+            st.warning(f"No monthly data found for {country_m_full}. Please check your folder.")
+        else:
+            split_by = None if split_m == "None" else split_m.lower()
+            trend_m = views.monthly_trend(
+                monthly, country_m,
+                sector=None if sector_m == "All sectors" else sector_m,
+                location=None if location_m == "All locations" else location_m,
+                freq=RESAMPLE_FREQUENCIES[frequency_m],
+                split_by=split_by,
+                gas=gas_m,
             )
-            fig_pie_b.update_layout(
-                uniformtext_minsize=10,
-                uniformtext_mode='hide',
-                legend=dict(font=dict(size=10)),
-                showlegend=True
-            )
-            st.plotly_chart(fig_pie_b, use_container_width=True, key='fig_b_pie')
-
-            # Data Table
-            st.subheader("Data Table – Location B")
-            st.dataframe(sector_df_b)
-
-            # NEW: Add 2021–2024 Trend Chart for Location B
-            st.subheader(f"{country_b_full} – CH₄ Emissions Trend (2021–2024)")
-            
-            combined_b_years = pd.DataFrame()
-            for year_iter in AVAILABLE_YEARS:
-                df_temp_b = load_country_year_data(country_b, year_iter)
-                if not df_temp_b.empty:
-                    df_temp_b['year'] = year_iter
-                    combined_b_years = pd.concat([combined_b_years, df_temp_b], ignore_index=True)
-                
-            if not combined_b_years.empty:
-                df_ch4_all_b = combined_b_years[combined_b_years['gas'] == 'ch4'].copy()
-                df_ch4_all_b['sector'] = df_ch4_all_b['original_inventory_sector'].map(sector_map).fillna('other')
-                
-                sector_time_df_b = (
-                    df_ch4_all_b.groupby(['year', 'sector'])['total_emission']
-                    .sum()
-                    .reset_index())
-                
-                fig_trend_b = px.bar(
-                    sector_time_df_b,
-                    x='year',
-                    y='total_emission',
-                    color='sector',
-                    labels={'total_emission': 'CH₄ Emissions', 'year': 'Year'},
-                    title=f"{country_b_full} CH₄ Emissions by Sector (2021–2024)")
-                st.plotly_chart(fig_trend_b, use_container_width=True, key='fig_trend_b')
-
+            scope = " – ".join(s for s in (sector_m, location_m) if not s.startswith("All "))
+            title_m = f"{country_m_full}{' – ' + scope if scope else ''} – {frequency_m} {label_m} Emissions"
+            st.subheader(title_m)
+            plotly_chart(views.fig_monthly_trend(trend_m, title_m, split_by=split_by, gas=gas_m))
+
+
+    # ========== TAB 5: Changes & Anomalies ==========
+    elif tab_selection == "🔺 Changes & Anomalies":
+
+        # Year-over-year changes and monthly z-scores of every country × sector × location,
+        # computed once for all series and kept until the data files change
+        changes = load_year_changes(DATA_FOLDER)
+
+        gas_c = gas_selectbox('tab5_gas', changes.gases)
+        label_c = GAS_LABELS[gas_c]
+
+        st.header(f"{label_c} Changes & Anomalies")
+
+        col1, col2, col3, col4 = st.columns([1, 3, 2, 1])
+        with col1:
+            years_c = changes.years[1:]
+            year_c = st.selectbox("Year", years_c, index=len(years_c) - 1, key='tab5_year') if years_c else None
+        with col2:
+            countries_c = st.multiselect("Countries (all if empty)", SMAC_COUNTRIES,
+                                         format_func=country_name_map.get, key='tab5_countries') or None
+        with col3:
+            sector_c = st.selectbox("Sector", ["All sectors"] + changes.sectors, key='tab5_sector')
+            sector_c = None if sector_c == "All sectors" else sector_c
+        with col4:
+            n_c = int(st.number_input("Top N", min_value=1, max_value=200, value=20, step=1, key='tab5_n'))
+
+        if year_c is None:
+            st.info("Year-over-year changes need files for at least two years.")
+        else:
+            previous_c = changes.previous_year(year_c)
+            st.subheader(f"Biggest Movers – {label_c}, {previous_c} → {year_c}")
+            movers_c = views.year_movers(changes, year_c, gas_c, countries_c, sector_c, n_c)
+            if movers_c.empty:
+                st.warning(f"No {label_c} emissions in {previous_c} or {year_c} for this selection.")
+            else:
+                plotly_chart(views.fig_year_movers(movers_c, year_c, previous_c, gas_c))
+                st.dataframe(views.movers_table(movers_c, year_c, previous_c, gas_c),
+                             hide_index=True, use_container_width=True)
+
+        st.subheader(f"Monthly Anomalies – {label_c}")
+        threshold_c = st.slider("Flag months with |z-score| of at least", min_value=1.5, max_value=5.0,
+                                value=min(max(ANOMALY_Z, 1.5), 5.0), step=0.1, key='tab5_z')
+        st.caption("Each month is compared with the same calendar month of its own country × sector × location "
+                   "series in the other years on file, so regular seasonal swings are not flagged.")
+        anomalies_c = load_monthly_anomalies(DATA_FOLDER).anomalies(gas_c, countries_c, sector_c, threshold_c, n_c)
+        if anomalies_c.empty:
+            st.info("No months reach this z-score for the selection.")
+        else:
+            st.dataframe(views.anomalies_table(anomalies_c), hide_index=True, use_container_width=True)
+            picked_c = st.selectbox(
+                "Show series", range(len(anomalies_c)), key='tab5_series',
+                format_func=lambda i: " – ".join([country_name_map.get(anomalies_c['country'].iloc[i], ''),
+                                                  str(anomalies_c['sector'].iloc[i]),
+                                                  str(anomalies_c['location'].iloc[i])]))
+            series_c = anomalies_c.iloc[picked_c]
+            trend_c = views.monthly_trend(load_monthly(DATA_FOLDER), series_c['country'],
+                                          sector=series_c['sector'], location=series_c['location'], gas=gas_c)
+            title_c = f"{country_name_map.get(series_c['country'])} – {series_c['sector']} – {series_c['location']}"
+            plotly_chart(views.fig_monthly_trend(trend_c, f"{title_c} – Monthly {label_c} Emissions", gas=gas_c))
+
+
+    # ========== TAB 6: Explore & export ==========
+    elif tab_selection == "🔎 Explore & export":
+
+        st.header("Explore & export")
+        st.caption("Any slice of the monthly rows – e.g. one sector across every country and year, "
+                   "or every location matching a name – served from the indexed SQLite query database.")
+
+        if not os.path.exists(query.db_path()):
+            st.info("The query database has not been built yet: run `python ingest.py --sqlite` "
+                    "or `python smac_query.py build`.")
+            st.stop()
+        if not query.database_current(DATA_FOLDER):
+            st.warning("The data files changed since the query database was built; results may be outdated. "
+                       "Run `python ingest.py --sqlite` to update it.")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            countries_x = st.multiselect("Countries", query.options("country"),
+                                         format_func=lambda c: country_name_map.get(c, c), key='tab6_country')
+            years_x = st.multiselect("Years", query.options("year"), key='tab6_year')
+        with col2:
+            gases_x = st.multiselect("Gases", query.options("gas"),
+                                     format_func=lambda g: GAS_LABELS.get(g, g), key='tab6_gas')
+            sectors_x = st.multiselect("Sectors", query.options("sector"), key='tab6_sector')
+        with col3:
+            subsectors_x = st.multiselect(
+                "Subsectors", [s for s in query.options("original_inventory_sector")
+                               if not sectors_x or sector_map.get(s, "other") in sectors_x], key='tab6_subsector')
+            location_x = st.text_input("Location contains", key='tab6_location').strip() or None
+
+        filters_x = {"country": countries_x, "year": years_x, "gas": gases_x,
+                     "sector": sectors_x, "original_inventory_sector": subsectors_x}
+        rows_x = query.count_rows(location_match=location_x, **filters_x)
+        st.caption(f"{rows_x:,} matching rows")
+
+        if rows_x:
+            st.subheader("Totals by country, year and gas")
+            totals_columns, totals_rows = query.group_sum(["country", "year", "gas"], location_match=location_x,
+                                                          **filters_x)
+            st.dataframe([dict(zip(totals_columns, row)) for row in totals_rows],
+                         hide_index=True, use_container_width=True)
+
+            st.subheader(f"Rows (first {min(rows_x, PREVIEW_ROWS):,} of {rows_x:,})")
+            preview_x = next(query.iter_rows(limit=PREVIEW_ROWS, location_match=location_x, **filters_x), [])
+            st.dataframe([dict(zip(query.COLUMNS, row)) for row in preview_x],
+                         hide_index=True, use_container_width=True)
+
+            st.download_button(f"⬇ Download all {rows_x:,} rows as CSV",
+                               data=lambda: export_download(location_x, filters_x),
+                               file_name="smac_emissions_export.csv", mime="text/csv", key='tab6_download')
+finally:
+    # Whichever artifacts this rerun loaded, name the files they had to leave out
+    unreadable = failed_files(DATA_FOLDER)
+    if unreadable:
+        file_problems.warning(
+            f"{len(unreadable)} data file(s) could not be read and are left out of the charts until they "
+            "change: " + "; ".join(f"{name} ({error})" for name, error in unreadable.items()))
+    # Closed even when a tab stops early (st.stop) or raises, so the run never stays
+    # current on this thread's context
+    if perf_run is not None:
+        perf.finish_run(perf_run)
+
+
+# ========== Performance diagnostics ==========
+if perf_run is not None and show_perf_panel:
+    history = st.session_state.setdefault('perf_history', [])
+    history.append({'Tab': perf_run.tab, 'Rerun (ms)': perf_run.total_ms})
+    del history[:-20]
+
+    st.markdown("---")
+    with st.expander("⏱ Performance diagnostics"):
+        st.caption(f"{perf_run.tab} – this rerun took {perf_run.total_ms:.1f} ms")
+        st.dataframe(perf_run.stage_totals(), hide_index=True, use_container_width=True)
+        st.dataframe(perf_run.records, hide_index=True, use_container_width=True)
+        st.caption("File cache")
+        st.json(data_cache.stats())
+        st.caption("View memo")
+        st.json(views.view_memo.stats())
+        st.caption("Figure cache")
+        st.json(figures.figure_cache.stats())
+        st.caption("Recent reruns in this session")
+        st.dataframe(history, hide_index=True, use_container_width=True)
@@ -0,0 +1,361 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – benchmark
+# ==============================================
+# Runs each tab's data pipeline headless and reports time and peak memory per
+# stage. Two pipelines are measured:
+#   rows – load raw rows, filter CH₄, map sectors, groupby, build figures
+#   cube – load the emissions cube's gas pivot, slice + groupby, build figures (what the app does)
+# The view memo and figure cache are emptied (untimed) before each pipeline of
+# every repeat, so groupby and figure stages time real work, not cache lookups;
+# "figure hit" times the same figures again, as a rerun of an unchanged view.
+#
+#   python generate_data.py --out bench_data
+#   python benchmark.py --data-folder bench_data --repeat 5 --json baseline.json
+#   python benchmark.py --data-folder bench_data --compare baseline.json
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+import smac_aggregates
+import smac_data
+import smac_figures
+import smac_views as views
+from smac_data import country_name_map, map_sector
+
+CUBE_SOURCE_COLUMNS = smac_aggregates.CUBE_SOURCE_COLUMNS
+
+
+class StageRecorder:
+    """Collects per-(pipeline, tab, stage) timings, or peak memory when tracking.
+
+    tracemalloc slows pandas down several-fold, so timings come from untracked
+    passes and peak memory from a separate tracked pass.
+    """
+
+    def __init__(self):
+        self.track_memory = False
+        self.times = {}
+        self.peaks = {}
+
+    @contextmanager
+    def stage(self, pipeline, tab, name):
+        key = (pipeline, tab, name)
+        gc.collect()
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            yield
+            peak = tracemalloc.get_traced_memory()[1] - before
+            self.peaks[key] = max(self.peaks.get(key, 0), peak)
+        else:
+            start = time.perf_counter()
+            yield
+            self.times.setdefault(key, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        rows = []
+        for (pipeline, tab, name), times in self.times.items():
+            rows.append({
+                "pipeline": pipeline, "tab": tab, "stage": name,
+                "median_ms": round(statistics.median(times) * 1000, 3),
+                "max_ms": round(max(times) * 1000, 3),
+                "peak_mb": round(self.peaks.get((pipeline, tab, name), 0) / 1024 ** 2, 3),
+            })
+        return rows
+
+
+def build_figures(figures):
+    # Serialize like st.plotly_chart does, so payload cost is part of the stage
+    for fig in figures:
+        fig.to_json()
+
+
+def cold_views():
+    # Process-wide caches that would otherwise serve every repeat after the first
+    views.view_memo.clear()
+    smac_figures.figure_cache.clear()
+
+
+def cube_figures(rec, tab, figures):
+    # `figures()` built from scratch, then again from the figure cache
+    with rec.stage("cube", tab, "figure"):
+        build_figures(figures())
+    with rec.stage("cube", tab, "figure hit"):
+        build_figures(figures())
+
+
+# ----------------------------------------------
+# rows pipeline: row-level work per rerun
+# ----------------------------------------------
+
+def load_rows(ctx, pairs):
+    df, _ = smac_data.load_country_years(pairs, columns=CUBE_SOURCE_COLUMNS,
+                                         folder=ctx["data_folder"], store_folder=ctx["store_folder"])
+    return df
+
+
+def rows_pipeline(rec, tab, ctx, pairs, groupby, figures):
+    cold_views()
+    with rec.stage("rows", tab, "load"):
+        df = load_rows(ctx, pairs)
+    with rec.stage("rows", tab, "filter"):
+        ch4 = df[df["gas"] == "ch4"].copy()
+    with rec.stage("rows", tab, "map sectors"):
+        ch4["sector"] = map_sector(ch4["original_inventory_sector"])
+    with rec.stage("rows", tab, "groupby"):
+        frames = groupby(ch4)
+    with rec.stage("rows", tab, "figure"):
+        build_figures(figures(frames))
+
+
+def rows_overview(ch4, year):
+    in_year = ch4[ch4["year"] == year]
+    country_emissions = (
+        in_year.groupby("country", observed=True)["total_emission"].sum().reset_index()
+        .sort_values(by="total_emission", ascending=False).astype({"country": str})
+    )
+    country_emissions["Country Full Name"] = country_emissions["country"].map(country_name_map)
+    country_emissions["Lat"] = country_emissions["country"].map(lambda x: views.country_centroids[x]["Lat"])
+    country_emissions["Lon"] = country_emissions["country"].map(lambda x: views.country_centroids[x]["Lon"])
+    sector_time_df = ch4.groupby(["year", "sector"], observed=True)["total_emission"].sum().reset_index()
+    top = (
+        in_year.groupby(["location", "country"], observed=True)["total_emission"].sum().reset_index()
+        .sort_values(by="total_emission", ascending=False).head(10).astype({"country": str})
+    )
+    top["Country Full Name"] = top["country"].map(country_name_map)
+    return country_emissions, sector_time_df, top
+
+
+def rows_country(ch4, country_code, year):
+    rows = ch4[ch4["country"] == country_code]
+    in_year = rows[rows["year"] == year]
+    subsectors = (
+        in_year.groupby(["original_inventory_sector", "sector"], observed=True)["total_emission"]
+        .sum().reset_index()[["original_inventory_sector", "total_emission", "sector"]]
+    )
+    trend = rows.groupby(["year", "sector"], observed=True)["total_emission"].sum().reset_index()
+    top = (
+        in_year.groupby("location", observed=True)["total_emission"].sum().reset_index()
+        .sort_values(by="total_emission", ascending=False).head(10)
+    )
+    return subsectors, trend, top
+
+
+def rows_changes(ch4, year, previous_year):
+    # One groupby per year, then aligned by merge – as flipping the year selector did
+    keys = ["country", "sector", "location"]
+    totals = [
+        ch4[ch4["year"] == y].groupby(keys, observed=True)["total_emission"].sum().rename(name)
+        for y, name in ((previous_year, "previous"), (year, "total_emission"))
+    ]
+    movers = pd.concat(totals, axis=1).fillna(0.0).reset_index()
+    movers["change"] = movers["total_emission"] - movers["previous"]
+    movers["change_pct"] = 100 * movers["change"] / movers["previous"].where(movers["previous"] != 0)
+    movers = movers.loc[movers["change"].abs().sort_values(ascending=False).index].head(20)
+    movers["Country Full Name"] = movers["country"].astype(str).map(country_name_map)
+    movers["series"] = movers["location"].astype(str) + " – " + movers["sector"].astype(str)
+    return movers
+
+
+# ----------------------------------------------
+# cube pipeline: what the dashboard runs
+# ----------------------------------------------
+
+def cube_load(rec, tab, ctx):
+    with rec.stage("cube", tab, "load"):
+        return smac_aggregates.load_gas_pivot(ctx["data_folder"], ctx["store_folder"])
+
+
+def top_index_load(rec, tab, ctx):
+    with rec.stage("cube", tab, "load"):
+        return smac_aggregates.load_top_locations(ctx["data_folder"], ctx["store_folder"])
+
+
+def run_overview(rec, ctx):
+    year, countries, years = ctx["year"], ctx["countries"], ctx["years"]
+    rows_pipeline(
+        rec, "overview", ctx, [(c, y) for y in years for c in countries],
+        lambda ch4: rows_overview(ch4, year),
+        lambda f: [views.fig_country_map(f[0], year), views.fig_sector_trend(f[1], "Sector"),
+                   views.fig_country_pie(f[0], year), views.fig_top_locations(f[2], year)],
+    )
+    cold_views()
+    cube = cube_load(rec, "overview", ctx)
+    top_index = top_index_load(rec, "overview", ctx)
+    with rec.stage("cube", "overview", "groupby"):
+        country_emissions = views.country_totals(cube, countries, year)
+        sector_time_df = views.sector_trend(cube, countries, years)
+        top = views.top_locations_group(top_index, countries, year)
+    cube_figures(rec, "overview", lambda: [views.fig_country_map(country_emissions, year),
+                                           views.fig_sector_trend(sector_time_df, "Sector"),
+                                           views.fig_country_pie(country_emissions, year),
+                                           views.fig_top_locations(top, year)])
+
+
+def country_figures(subsectors, trend, bar_title="Sector Breakdown"):
+    return [views.fig_sector_bar(views.sector_totals(subsectors), bar_title),
+            views.fig_subsector_pie(subsectors, "Subsector Breakdown"),
+            views.fig_sector_trend(trend, "Trend")]
+
+
+def run_member(rec, ctx):
+    country_code, year, years = ctx["countries"][0], ctx["year"], ctx["years"]
+    rows_pipeline(
+        rec, "member", ctx, [(country_code, y) for y in years],
+        lambda ch4: rows_country(ch4, country_code, year),
+        lambda f: country_figures(f[0], f[1]),
+    )
+    cold_views()
+    cube = cube_load(rec, "member", ctx)
+    top_index = top_index_load(rec, "member", ctx)
+    with rec.stage("cube", "member", "groupby"):
+        subsectors = views.subsector_totals(cube, country_code, year)
+        views.top_locations_table(top_index, country_code, year)
+        trend = views.sector_trend(cube, country_code, years)
+    cube_figures(rec, "member", lambda: country_figures(subsectors, trend))
+
+
+def run_comparison(rec, ctx):
+    a, b = ctx["countries"][0], ctx["countries"][-1]
+    year_a, year_b, years = ctx["year"], ctx["years"][0], ctx["years"]
+    rows_pipeline(
+        rec, "comparison", ctx, [(c, y) for c in (a, b) for y in years],
+        lambda ch4: (rows_country(ch4, a, year_a), rows_country(ch4, b, year_b)),
+        lambda f: country_figures(f[0][0], f[0][1]) + country_figures(f[1][0], f[1][1]),
+    )
+    cold_views()
+    cube = cube_load(rec, "comparison", ctx)
+    selections = ((a, year_a), (b, year_b))
+    with rec.stage("cube", "comparison", "groupby"):
+        for c, y in selections:
+            views.comparison_summary(cube, c, y, years)
+    # The panels' data is memoized by the groupby stage, as within one rerun of the app
+    cube_figures(rec, "comparison",
+                 lambda: [fig for c, y in selections for fig in views.comparison_figures(cube, c, y, years)])
+
+
+def run_changes(rec, ctx):
+    year, years = ctx["year"], ctx["years"]
+    if len(years) < 2:
+        return
+    previous_year = years[-2]
+    rows_pipeline(
+        rec, "changes", ctx, [(c, y) for c in ctx["countries"] for y in (previous_year, year)],
+        lambda ch4: rows_changes(ch4, year, previous_year),
+        lambda f: [views.fig_year_movers(f, year, previous_year)],
+    )
+    cold_views()
+    with rec.stage("cube", "changes", "load"):
+        changes = smac_aggregates.load_year_changes(ctx["data_folder"], ctx["store_folder"])
+        anomalies = smac_aggregates.load_monthly_anomalies(ctx["data_folder"], ctx["store_folder"])
+    with rec.stage("cube", "changes", "groupby"):
+        movers = views.year_movers(changes, year)
+        anomalies.anomalies()
+    cube_figures(rec, "changes", lambda: [views.fig_year_movers(movers, year, previous_year)])
+
+
+TABS = {"overview": run_overview, "member": run_member, "comparison": run_comparison, "changes": run_changes}
+
+
+# ----------------------------------------------
+# Reporting
+# ----------------------------------------------
+
+def print_table(rows):
+    print(f"{'pipeline':<8} {'tab':<11} {'stage':<12} {'median ms':>11} {'max ms':>11} {'peak MB':>9}")
+    for r in rows:
+        print(f"{r['pipeline']:<8} {r['tab']:<11} {r['stage']:<12} "
+              f"{r['median_ms']:>11.2f} {r['max_ms']:>11.2f} {r['peak_mb']:>9.2f}")
+
+
+def compare(rows, baseline_rows, tolerance):
+    """Stages whose median time exceeds `tolerance` × the baseline median."""
+    baseline = {(r["pipeline"], r["tab"], r["stage"]): r for r in baseline_rows}
+    regressions = []
+    for r in rows:
+        base = baseline.get((r["pipeline"], r["tab"], r["stage"]))
+        # Ignore sub-millisecond stages, their noise dwarfs any real change
+        if base and r["median_ms"] > 1 and r["median_ms"] > tolerance * base["median_ms"]:
+            regressions.append((r, base))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's tab pipelines headless.")
+    parser.add_argument("--data-folder", default=smac_data.DATA_FOLDER)
+    parser.add_argument("--store-folder",
+                        help="columnar store for --data-folder (default: store/ for data/, else <data-folder>/store)")
+    parser.add_argument("--tabs", nargs="*", choices=list(TABS), default=list(TABS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cold", action="store_true",
+                        help="clear the file, cube, view and figure caches before every repeat")
+    parser.add_argument("--trim", action="store_true", help="build figures with payload trimming (as ?lite=1)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass (no peak MB)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown vs --compare (default 1.25)")
+    args = parser.parse_args(argv)
+
+    store_folder = args.store_folder or (
+        smac_data.STORE_FOLDER if args.data_folder == smac_data.DATA_FOLDER
+        else os.path.join(args.data_folder, "store"))
+    files = list(smac_data.discover_csv_files(args.data_folder))
+    if not files:
+        sys.exit(f"No {{ISO3}}_{{YEAR}}.csv files in {args.data_folder}")
+    ctx = {
+        "data_folder": args.data_folder,
+        "store_folder": store_folder,
+        "countries": sorted({c for c, _, _ in files}),
+        "years": sorted({y for _, y, _ in files}),
+    }
+    ctx["year"] = ctx["years"][-1]
+    print(f"{len(files)} files, {len(ctx['countries'])} countries, years {ctx['years']}")
+
+    smac_figures.set_trim(args.trim)
+    rec = StageRecorder()
+
+    def run_all():
+        if args.cold:
+            smac_data.data_cache.clear()
+            smac_aggregates.clear_artifact_cache()
+            views.view_memo.clear()
+            smac_figures.figure_cache.clear()
+        for tab in args.tabs:
+            TABS[tab](rec, ctx)
+
+    for _ in range(args.repeat):
+        run_all()
+    if not args.no_memory:
+        rec.track_memory = True
+        tracemalloc.start()
+        run_all()
+        tracemalloc.stop()
+
+    rows = rec.summary()
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"files": len(files), "results": rows}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(rows, json.load(f)["results"], args.tolerance)
+        for r, base in regressions:
+            print(f"REGRESSION {r['pipeline']}/{r['tab']}/{r['stage']}: "
+                  f"{r['median_ms']:.2f} ms vs {base['median_ms']:.2f} ms baseline")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than {args.tolerance}x baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – synthetic data
+# ==============================================
+# Writes {ISO3}_{YEAR}.csv files in the real inventory schema for every SMAC
+# country, for benchmarking and load testing. Never writes into data/ unless asked.
+#
+#   python generate_data.py --out bench_data --years 4 --locations 9
+#   python generate_data.py --out bench_data --years 10 --locations 500
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from smac_data import GASES, GWP_100, GWP_20, country_name_map, sector_map
+
+COLUMNS = ["iso3_country", "start_time", "end_time", "original_inventory_sector",
+           "gas", "location", "total_emission", "year"]
+
+
+def month_bounds(year):
+    starts = pd.date_range(f"{year}-01-01", periods=12, freq="MS")
+    ends = starts + pd.offsets.MonthEnd(0)
+    return starts.strftime("%Y-%m-%dT%H:%M:%SZ"), ends.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def generate_country_year(country_code, year, n_locations, rng):
+    """One country-year frame: 12 months × every subsector × 5 gases × n_locations rows."""
+    sectors = np.array(sorted(sector_map))
+    locations = np.array([f"{country_name_map[country_code]} Region {i + 1:03d}" for i in range(n_locations)])
+    starts, ends = month_bounds(year)
+    n_months, n_sectors = 12, len(sectors)
+
+    # Base emissions per (month, sector, location): heavy-tailed, many sources exactly zero
+    shape = (n_months, n_sectors, n_locations)
+    scale = rng.lognormal(mean=6.0, sigma=2.0, size=(1, n_sectors, n_locations))
+    seasonal = 1 + 0.15 * np.sin(np.arange(n_months) / 12 * 2 * np.pi)[:, None, None]
+    active = rng.random((1, n_sectors, n_locations)) > 0.35
+    base = scale * seasonal * active * rng.uniform(0.9, 1.1, size=shape)
+
+    gas_values = {
+        "co2": base * rng.uniform(0.0, 50.0, size=(1, n_sectors, 1)),
+        "ch4": base * rng.uniform(0.0, 1.0, size=(1, n_sectors, 1)),
+        "n2o": base * rng.uniform(0.0, 0.05, size=(1, n_sectors, 1)),
+    }
+    gas_values["co2e_100yr"] = gas_values["co2"] + sum(gas_values[g] * GWP_100[g] for g in GWP_100)
+    gas_values["co2e_20yr"] = gas_values["co2"] + sum(gas_values[g] * GWP_20[g] for g in GWP_20)
+
+    frames = []
+    month_idx, sector_idx, location_idx = np.meshgrid(
+        np.arange(n_months), np.arange(n_sectors), np.arange(n_locations), indexing="ij")
+    for gas in GASES:
+        frames.append(pd.DataFrame({
+            "iso3_country": country_code,
+            "start_time": starts[month_idx.ravel()],
+            "end_time": ends[month_idx.ravel()],
+            "original_inventory_sector": sectors[sector_idx.ravel()],
+            "gas": gas,
+            "location": locations[location_idx.ravel()],
+            "total_emission": gas_values[gas].ravel().round(6),
+            "year": year,
+        }))
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
+
+
+def generate(out_folder, years, n_locations, countries=None, seed=0):
+    os.makedirs(out_folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    written = 0
+    for country_code in countries or list(country_name_map):
+        for year in years:
+            df = generate_country_year(country_code, year, n_locations, rng)
+            df.to_csv(os.path.join(out_folder, f"{country_code}_{year}.csv"), index=False)
+            written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic SMAC inventory files.")
+    parser.add_argument("--out", default="bench_data", help="output folder (default: bench_data)")
+    parser.add_argument("--years", type=int, default=4, help="number of years, counting from --first-year")
+    parser.add_argument("--first-year", type=int, default=2021)
+    parser.add_argument("--locations", type=int, default=9, help="locations per country")
+    parser.add_argument("--countries", nargs="*", help="ISO3 codes (default: all SMAC countries)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    years = range(args.first_year, args.first_year + args.years)
+    written = generate(args.out, years, args.locations, args.countries, args.seed)
+    print(f"Wrote {written} files to {args.out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – ingest
+# ==============================================
+# Converts data/{ISO3}_{YEAR}.csv into the columnar store read by the dashboard
+# and materializes the derived artifacts (emissions cube, monthly rollup) every
+# chart is sliced from. store/manifest.json records each file's signature,
+# content hash, row count and columns, so a rerun only converts new or revised
+# files and only replaces their rows in the artifacts. Files larger than
+# SMAC_STREAM_THRESHOLD_MB are converted and aggregated in bounded chunks.
+# Last, it snapshots the default view's figures for fast cold starts (skipped
+# when a file failed or the snapshot already matches the files) and, with
+# --sqlite, updates the SQLite query backend (smac_query) the same way.
+#
+# Files are processed on a pool of worker processes: each converts its file and
+# returns the file's artifact partials, which are merged in file order, so the
+# output does not depend on the worker count or on completion order. A file that
+# fails is reported and left out; the next run retries it.
+#
+#   python ingest.py                # convert new or changed files
+#   python ingest.py --force        # rebuild everything
+#   python ingest.py --workers 1    # serial, in this process
+#   python ingest.py --sqlite       # also build/update the query database
+#
+#   SMAC_INGEST_WORKERS   worker processes (default: one per core)
+
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import smac_aggregates
+import smac_data
+import smac_manifest
+import smac_query
+import smac_startup
+import smac_stream
+
+INGEST_WORKERS = int(os.environ.get("SMAC_INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+
+# ----------------------------------------------
+# Per-file work (runs in the worker processes)
+# ----------------------------------------------
+
+def store_file(country_code, year, csv_path, entry, data_folder, store_folder, force=False):
+    """(manifest entry, status) for one CSV, converting it unless its store file is current.
+
+    `entry` is the file's previous manifest entry (None if unrecorded); status is
+    "converted" or "up to date".
+    """
+    parquet_path = smac_data.store_path(country_code, year, store_folder)
+    signature = list(smac_data.file_signature(csv_path))
+    fresh = smac_data.store_is_fresh(csv_path, parquet_path)
+    if not force and entry is not None and entry["signature"] == signature and fresh:
+        return entry, "up to date"
+
+    sha256 = smac_manifest.file_sha256(csv_path)
+    if not force and os.path.exists(parquet_path) and (
+            # Touched but identical, or converted before the manifest existed
+            (entry is not None and entry["sha256"] == sha256) or (entry is None and fresh)):
+        if not fresh:
+            # Same content under a new signature: keep the rows, record the signature
+            smac_data.restamp_store(parquet_path, csv_path)
+        rows = smac_manifest.parquet_rows(parquet_path)
+        return smac_manifest.manifest_entry(country_code, year, csv_path, sha256, rows), "up to date"
+
+    if smac_stream.should_stream(country_code, year, data_folder, store_folder):
+        rows = smac_stream.convert_csv_to_store_chunked(csv_path, parquet_path)
+    else:
+        rows = smac_data.convert_csv_to_store(csv_path, parquet_path)
+    return smac_manifest.manifest_entry(country_code, year, csv_path, sha256, rows), "converted"
+
+
+def ingest_file(task):
+    """Bring one file's store entry up to date and roll it up to the artifacts in `names`.
+
+    Returns a dict with the file's manifest entry, status, partials ({name: df})
+    and timing, or its error and traceback; never raises, so one bad file does
+    not stop the others.
+    """
+    country_code, year, csv_path, entry, names, data_folder, store_folder, force = task
+    start = time.perf_counter()
+    result = {"file": os.path.basename(csv_path), "country": country_code, "year": year}
+    try:
+        result["entry"], result["status"] = store_file(country_code, year, csv_path, entry,
+                                                       data_folder, store_folder, force)
+        if names:
+            partials = smac_aggregates.file_partials(names, [(country_code, year, csv_path)],
+                                                     data_folder, store_folder, max_workers=1)
+            result["partials"] = {name: parts[0] for name, parts in partials.items()}
+    except Exception as exc:
+        result["error"] = f"{type(exc).__name__}: {exc}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_tasks(tasks, workers):
+    """Yield ingest_file results as they finish, on `workers` processes (in this process if 1)."""
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(ingest_file, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = [pool.submit(ingest_file, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def describe(result, data_folder, store_folder):
+    if "error" in result:
+        return f"FAILED ({result['error'].splitlines()[0]})"
+    text = result["status"]
+    if result["status"] == "converted":
+        csv_path = smac_data.country_year_path(result["country"], result["year"], data_folder)
+        parquet_path = smac_data.store_path(result["country"], result["year"], store_folder)
+        text += f", {result['entry']['rows']} rows"
+        if os.path.exists(csv_path):
+            text += f", {os.path.getsize(csv_path) / os.path.getsize(parquet_path):.1f}x smaller"
+    if result.get("partials"):
+        text += ", rolled up"
+    return f"{text} ({result['seconds']:.2f}s)"
+
+
+# ----------------------------------------------
+# Ingest
+# ----------------------------------------------
+
+def ingest(data_folder, store_folder, force=False, workers=INGEST_WORKERS, sqlite=False):
+    """Update the store, manifest and artifacts; returns the failed files' results."""
+    start = time.perf_counter()
+    files = list(smac_data.discover_csv_files(data_folder))
+    # Read even under --force: store_file ignores the entries then, but deleted CSVs'
+    # store files are still found by diffing against it
+    previous = smac_manifest.read_manifest(store_folder)
+    sources = smac_aggregates.data_sources(data_folder)
+
+    # Which artifacts need each file's partials: all of them for a full build
+    plans = {}
+    for name in smac_aggregates.ARTIFACTS:
+        path = smac_aggregates.artifact_path(name, store_folder)
+        recorded = {} if force or not os.path.exists(path) else smac_aggregates.read_artifact_sources(path)
+        changed, removed = smac_aggregates.changed_sources(recorded, sources)
+        plans[name] = (path, recorded, changed, removed)
+    needs = {}
+    for name, (_, _, changed, _) in plans.items():
+        for file_name in changed:
+            needs.setdefault(file_name, []).append(name)
+
+    tasks = [(country_code, year, csv_path, previous.get(os.path.basename(csv_path)),
+              needs.get(os.path.basename(csv_path), []), data_folder, store_folder, force)
+             for country_code, year, csv_path in files]
+    print(f"Ingesting {len(tasks)} files on {max(1, min(workers, len(tasks)))} worker(s)")
+    results = {}
+    for done, result in enumerate(run_tasks(tasks, workers), 1):
+        results[result["file"]] = result
+        print(f"  [{done}/{len(tasks)}] {result['country']} {result['year']}: "
+              f"{describe(result, data_folder, store_folder)}")
+    # Merge in file order, whatever order the workers finished in
+    results = [results[os.path.basename(csv_path)] for _, _, csv_path in files]
+    failed = [r for r in results if "error" in r]
+
+    write_store_manifest(results, previous, store_folder)
+    write_artifacts(plans, results, sources, store_folder)
+    if failed:
+        print(f"{len(failed)} of {len(results)} files failed (left out; retried on the next run):", file=sys.stderr)
+        for result in failed:
+            print(f"\n{result['file']}: {result['error']}\n{result['traceback']}", file=sys.stderr)
+
+    # Optional steps: neither re-reads a file that just failed, and a snapshot error only costs
+    # the cold-start shortcut (the dashboard builds the default view on first use instead)
+    if failed:
+        print(f"Snapshot: skipped, {len(failed)} file(s) failed")
+    elif results and not force and smac_startup.snapshot_current(data_folder, store_folder):
+        print(f"Snapshot: up to date -> {smac_startup.snapshot_path(store_folder)}")
+    elif results:
+        try:
+            count = smac_startup.write_snapshot(data_folder, store_folder)
+        except Exception as exc:
+            print(f"Snapshot: FAILED ({type(exc).__name__}: {exc})\n{traceback.format_exc()}", file=sys.stderr)
+        else:
+            print(f"Snapshot: {count} default-view figures -> {smac_startup.snapshot_path(store_folder)}")
+    if sqlite:
+        db_path = smac_query.db_path(store_folder)
+        counts = smac_query.build_database(data_folder, db_path, force=force, skip={r["file"] for r in failed})
+        print(f"Query database: {counts['loaded']} loaded, {counts['up to date']} up to date, "
+              f"{counts['removed']} removed, {counts['skipped']} skipped -> {db_path}")
+    print(f"Ingest done in {time.perf_counter() - start:.2f}s")
+    return failed
+
+
+def write_store_manifest(results, previous, store_folder):
+    """Record successful files in the manifest and drop store files of deleted CSVs."""
+    manifest = {r["file"]: r["entry"] for r in results if "error" not in r}
+    converted = sum(r.get("status") == "converted" for r in results)
+    present = {r["file"] for r in results}
+    removed = sorted(set(previous) - present)
+    for name in removed:
+        entry = previous[name]
+        parquet_path = smac_data.store_path(entry["country"], entry["year"], store_folder)
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        print(f"  {entry['country']} {entry['year']}: removed")
+    smac_manifest.write_manifest(manifest, store_folder)
+    print(f"Store: {converted} converted, {len(manifest) - converted} up to date, {len(removed)} removed, "
+          f"{len(results) - len(manifest)} failed -> {store_folder}")
+
+
+def write_artifacts(plans, results, sources, store_folder):
+    """Write each artifact from the merged partials, replacing only changed files' rows when it exists.
+
+    A failed file keeps its previous rows and recorded signature (or stays out of
+    a fresh build), so the next run sees it as changed again.
+    """
+    failed = {r["file"] for r in results if "error" in r}
+    for name, (path, recorded, changed, removed) in plans.items():
+        if not changed and not removed:
+            print(f"{name.capitalize()}: up to date -> {path}")
+            if not smac_aggregates.array_tables_current(name, recorded, store_folder):
+                smac_aggregates.write_array_tables(name, smac_aggregates.read_artifact(path), recorded, store_folder)
+                print(f"{name.capitalize()}: array tables written")
+            continue
+        ok = [file_name for file_name in changed if file_name not in failed]
+        partials = {name: [r["partials"][name] for r in results if r["file"] in ok]}
+        keys = smac_aggregates.ARTIFACTS[name][1]
+        if recorded:
+            df = smac_aggregates.replace_file_rows({name: smac_aggregates.read_artifact(path)},
+                                                   ok + list(removed), partials)[name]
+            action = f"updated {len(ok)} changed, {len(removed)} removed of {len(sources)} files"
+        else:
+            df = smac_aggregates.combine_partials(partials[name], keys)
+            action = f"built from {len(ok)} files"
+        written = {file_name: signature for file_name, signature in sources.items() if file_name not in failed}
+        written.update({file_name: recorded[file_name] for file_name in failed if file_name in recorded})
+        smac_aggregates.write_artifact(df, path, written)
+        smac_aggregates.write_array_tables(name, df, written, store_folder)
+        print(f"{name.capitalize()}: {len(df)} rows, {action} -> {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the dashboard's columnar data store.")
+    parser.add_argument("--data-folder", default=smac_data.DATA_FOLDER)
+    parser.add_argument("--store-folder", default=smac_data.STORE_FOLDER)
+    parser.add_argument("--force", action="store_true", help="rebuild files that are already up to date")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="worker processes (1 = serial)")
+    parser.add_argument("--sqlite", action="store_true", help="also build/update the SQLite query database")
+    args = parser.parse_args(argv)
+    failed = ingest(args.data_folder, args.store_folder, force=args.force, workers=args.workers,
+                    sqlite=args.sqlite)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,743 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – aggregates
+# ==============================================
+# Derived artifacts built from every country-year file:
+#   cube    – total_emission summed over the monthly rows, keyed by
+#             country × year × gas × sector × original_inventory_sector × location.
+#             Every annual chart is a filter + small groupby over its gas pivot
+#             (same keys minus gas, one total_emission column per gas).
+#   monthly – monthly rollup keyed by country × month × gas × sector × location,
+#             behind the monthly trends explorer and its quarter/year resampling.
+#
+# Ingest also writes the gas pivot and the monthly rollup as memory-mapped
+# array tables (smac_arrays); while they match the CSVs the dashboard
+# aggregates those in place instead of holding pandas copies (SMAC_ARRAYS=0 to
+# turn this off).
+#
+# Every artifact row belongs to one country-year file, so when files are added,
+# revised or removed only their rows are replaced (update_artifacts).
+#
+# Year-over-year changes (YearChanges) and monthly anomaly z-scores
+# (MonthlyAnomalies) are computed for every series at once and kept, like the
+# top-N index, until the files behind them change. A country-year without a
+# file is missing (NaN) there, not zero.
+#
+#   SMAC_ANOMALY_Z   |z| at which a month is flagged as anomalous (default 2)
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from smac_arrays import ArrayFrame, read_array_sources, write_arrays
+from smac_perf import map_in_context, timed
+from smac_data import (DATA_FOLDER, FILE_PATTERN, GASES, LOAD_WORKERS, STORE_FOLDER, discover_csv_files,
+                       file_signature, map_sector, month_start, read_country_year)
+from smac_stream import should_stream, stream_partials
+
+CUBE_KEYS = ["country", "year", "gas", "sector", "original_inventory_sector", "location"]
+CUBE_SOURCE_COLUMNS = ["original_inventory_sector", "gas", "location", "total_emission"]
+PIVOT_KEYS = [key for key in CUBE_KEYS if key != "gas"]
+MONTHLY_KEYS = ["country", "month", "gas", "sector", "location"]
+MONTHLY_SOURCE_COLUMNS = ["start_time"] + CUBE_SOURCE_COLUMNS
+SOURCES_METADATA_KEY = b"smac_sources"
+USE_ARRAYS = os.environ.get("SMAC_ARRAYS", "1") == "1"
+
+
+def data_sources(data_folder=None):
+    """{file name: [mtime_ns, size]} of every country-year CSV – the artifacts' cache key."""
+    return {
+        os.path.basename(path): list(file_signature(path))
+        for _, _, path in discover_csv_files(data_folder)
+    }
+
+
+# ----------------------------------------------
+# Per-file partials
+# ----------------------------------------------
+
+def cube_partial(df, country_code, year):
+    """Roll one country-year frame up to cube rows (monthly rows summed away)."""
+    part = (
+        df.groupby(["gas", "original_inventory_sector", "location"], observed=True, dropna=False)
+        ["total_emission"].sum()
+        .reset_index()
+    )
+    part["country"] = country_code
+    part["year"] = int(year)
+    part["sector"] = map_sector(part["original_inventory_sector"])
+    return part[CUBE_KEYS + ["total_emission"]]
+
+
+def monthly_partial(df, country_code, year):
+    """Roll one country-year frame up to monthly rows per gas, sector and location."""
+    # Subsector -> sector first on the small cube-shaped partial, then join by subsector
+    by_subsector = (
+        df.assign(month=month_start(df["start_time"]))
+        .groupby(["month", "gas", "original_inventory_sector", "location"], observed=True, dropna=False)
+        ["total_emission"].sum()
+        .reset_index()
+    )
+    by_subsector["sector"] = map_sector(by_subsector["original_inventory_sector"])
+    part = (
+        by_subsector.groupby(["month", "gas", "sector", "location"], observed=True, dropna=False)
+        ["total_emission"].sum()
+        .reset_index()
+    )
+    part["country"] = country_code
+    return part[MONTHLY_KEYS + ["total_emission"]]
+
+
+def combine_partials(partials, keys):
+    """Concatenate per-file partials into one frame with categorical keys."""
+    partials = [p for p in partials if p is not None and not p.empty]
+    if not partials:
+        return pd.DataFrame(columns=keys + ["total_emission"])
+    combined = pd.concat(partials, ignore_index=True)
+    combined = combined.astype({key: "category" for key in keys if key not in ("year", "month")})
+    if "year" in combined:
+        combined["year"] = combined["year"].astype("int16")
+    return combined.sort_values(keys, ignore_index=True)
+
+
+# name -> (file in the store folder, keys, source columns, per-file partial)
+ARTIFACTS = {
+    "cube": ("cube.parquet", CUBE_KEYS, CUBE_SOURCE_COLUMNS, cube_partial),
+    "monthly": ("monthly.parquet", MONTHLY_KEYS, MONTHLY_SOURCE_COLUMNS, monthly_partial),
+}
+
+
+def artifact_path(name, store_folder=None):
+    return os.path.join(store_folder or STORE_FOLDER, ARTIFACTS[name][0])
+
+
+def file_partials(names, files, data_folder=None, store_folder=None, max_workers=LOAD_WORKERS, failed=None):
+    """{name: [partial per file]} for (country, year, path) `files`, reading each file once.
+
+    Files above SMAC_STREAM_THRESHOLD_MB are streamed in bounded chunks (smac_stream)
+    one at a time after the others, so only one of them is in flight at once.
+    With a `failed` dict, a file that cannot be read is recorded there as
+    {file name: error} and left out instead of raising.
+    """
+    columns = sorted({c for name in names for c in ARTIFACTS[name][2]})
+    streamed = [should_stream(country_code, year, data_folder, store_folder) for country_code, year, _ in files]
+
+    def partials(entry):
+        country_code, year, _ = entry
+        df = read_country_year(country_code, year, columns=columns,
+                               folder=data_folder, store_folder=store_folder)
+        return {name: ARTIFACTS[name][3](df, country_code, year) for name in names}
+
+    fns = {name: (ARTIFACTS[name][1], ARTIFACTS[name][3]) for name in names}
+
+    def streamed_partials(entry):
+        return stream_partials(fns, entry[0], entry[1], columns, data_folder, store_folder)
+
+    def attempt(read):
+        if failed is None:
+            return read
+
+        def guarded(entry):
+            try:
+                return read(entry)
+            except Exception as exc:
+                failed[os.path.basename(entry[2])] = f"{type(exc).__name__}: {exc}"
+                return None
+        return guarded
+
+    in_memory = [entry for entry, stream in zip(files, streamed) if not stream]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(in_memory) or 1))) as pool:
+        per_file = iter(map_in_context(pool, attempt(partials), in_memory))
+    per_file = [
+        attempt(streamed_partials)(entry) if stream else next(per_file)
+        for entry, stream in zip(files, streamed)
+    ]
+    return {name: [p[name] for p in per_file if p is not None] for name in names}
+
+
+def build_artifacts(names=tuple(ARTIFACTS), data_folder=None, store_folder=None, max_workers=LOAD_WORKERS,
+                    failed=None):
+    """Build the named artifacts from every country-year file in one read per file."""
+    files = list(discover_csv_files(data_folder))
+    partials = file_partials(names, files, data_folder, store_folder, max_workers, failed)
+    return {name: combine_partials(partials[name], ARTIFACTS[name][1]) for name in names}
+
+
+def changed_sources(recorded, current):
+    """(files added or revised since `recorded`, files removed), by file name."""
+    changed = sorted(name for name, signature in current.items() if recorded.get(name) != signature)
+    removed = sorted(name for name in recorded if name not in current)
+    return changed, removed
+
+
+def update_artifacts(artifacts, changed, removed, data_folder=None, store_folder=None, max_workers=LOAD_WORKERS,
+                     failed=None):
+    """{name: df} with the rows of changed and removed files replaced by fresh partials of the changed ones.
+
+    Only the changed files are read, so adding one country-year costs one file's work.
+    A changed file that fails (with a `failed` dict) loses its old rows too.
+    """
+    with timed("update artifacts", f"{len(changed)} changed, {len(removed)} removed"):
+        names = set(changed)
+        files = [f for f in discover_csv_files(data_folder) if os.path.basename(f[2]) in names]
+        partials = file_partials(list(artifacts), files, data_folder, store_folder, max_workers, failed)
+        return replace_file_rows(artifacts, list(changed) + list(removed), partials)
+
+
+def replace_file_rows(artifacts, file_names, partials):
+    """{name: df} with the rows of `file_names` dropped and `partials` ({name: [partial]}) added."""
+    stale = set()
+    for file_name in file_names:
+        match = FILE_PATTERN.match(file_name)
+        stale.add((match.group(1), int(match.group(2))))
+
+    updated = {}
+    for name, df in artifacts.items():
+        years = df["year"] if "year" in df else df["month"].dt.year
+        stale_rows = pd.Series(False, index=df.index)
+        for country_code, year in stale:
+            stale_rows |= (df["country"] == country_code) & (years == year)
+        updated[name] = combine_partials([df[~stale_rows]] + partials[name], ARTIFACTS[name][1])
+    return updated
+
+
+def read_artifact(path):
+    return pq.read_table(path).to_pandas()
+
+
+def write_artifact(df, path, sources):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCES_METADATA_KEY] = json.dumps(sources, sort_keys=True).encode()
+    table = table.replace_schema_metadata(metadata)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pq.write_table(table, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+
+def read_artifact_sources(path):
+    metadata = pq.read_schema(path).metadata or {}
+    return json.loads(metadata.get(SOURCES_METADATA_KEY, b"{}"))
+
+
+# ----------------------------------------------
+# Loading (process-wide, invalidated when any CSV changes)
+# ----------------------------------------------
+
+# _artifact_lock guards the dicts below and is only held for lookups and swaps.
+# Builds run under a lock of their own cache key, so a slow build (reading CSVs)
+# only holds up threads waiting for that same object; cache hits and other
+# objects go ahead.
+_artifact_lock = threading.Lock()
+_build_locks = {}      # ("artifact" | "derived" | "array", name, data_folder, store_folder) -> RLock
+_artifact_cache = {}   # (name, data_folder, store_folder) -> (sources, df)
+_derived_cache = {}    # (name, data_folder, store_folder) -> (cube, derived object)
+_failed_files = {}     # (data_folder, file name) -> (signature, error) of files that could not be read
+
+
+def _build_lock(key):
+    with _artifact_lock:
+        return _build_locks.setdefault(key, threading.RLock())
+
+
+def readable_sources(data_folder=None):
+    """data_sources() without the files that failed to load at their current signature."""
+    data_folder = data_folder or DATA_FOLDER
+    sources = data_sources(data_folder)
+    with _artifact_lock:
+        return {file_name: signature for file_name, signature in sources.items()
+                if _failed_files.get((data_folder, file_name), (None,))[0] != signature}
+
+
+def failed_files(data_folder=None):
+    """{file name: error} of the current files left out of the artifacts because they could not be read."""
+    data_folder = data_folder or DATA_FOLDER
+    sources = data_sources(data_folder)
+    with _artifact_lock:
+        return {file_name: error for (folder, file_name), (signature, error) in sorted(_failed_files.items())
+                if folder == data_folder and sources.get(file_name) == signature}
+
+
+def failed_pairs(data_folder=None):
+    """(country, year) of the files in failed_files()."""
+    return {(match.group(1), int(match.group(2)))
+            for match in map(FILE_PATTERN.match, failed_files(data_folder)) if match}
+
+
+def load_artifact(name, data_folder=None, store_folder=None):
+    """Return artifact `name` for the current files in `data_folder`.
+
+    Starts from the cached or ingested copy and, when CSVs were added, revised
+    or removed since it was built, replaces only those files' rows. Without any
+    copy it builds from every file. A file that cannot be read is left out (see
+    failed_files) until it changes again. The result is shared by all sessions.
+    """
+    with timed(name):
+        data_folder = data_folder or DATA_FOLDER
+        key = (name, data_folder, store_folder or STORE_FOLDER)
+        sources = readable_sources(data_folder)
+        with _artifact_lock:
+            cached = _artifact_cache.get(key)
+        if cached is not None and cached[0] == sources:
+            return cached[1]
+
+        with _build_lock(("artifact",) + key):
+            # Another thread may have brought it up to date while this one waited
+            with _artifact_lock:
+                cached = _artifact_cache.get(key)
+            if cached is not None and cached[0] == sources:
+                return cached[1]
+
+            path = artifact_path(name, store_folder)
+            if cached is None and os.path.exists(path):
+                cached = (read_artifact_sources(path), read_artifact(path))
+            failed = {}
+            if cached is None:
+                df = build_artifacts((name,), data_folder, store_folder, failed=failed)[name]
+            elif cached[0] != sources:
+                changed, removed = changed_sources(cached[0], sources)
+                df = update_artifacts({name: cached[1]}, changed, removed, data_folder, store_folder,
+                                      failed=failed)[name]
+            else:
+                df = cached[1]
+            with _artifact_lock:
+                for file_name, error in failed.items():
+                    if file_name in sources:
+                        _failed_files[(data_folder, file_name)] = (sources.pop(file_name), error)
+                _artifact_cache[key] = (sources, df)
+            return df
+
+
+def load_cube(data_folder=None, store_folder=None):
+    return load_artifact("cube", data_folder, store_folder)
+
+
+def load_monthly(data_folder=None, store_folder=None):
+    if USE_ARRAYS:
+        table = load_array_table("monthly", data_folder, store_folder)
+        if table is not None:
+            return table
+    return load_artifact("monthly", data_folder, store_folder)
+
+
+def clear_artifact_cache():
+    with _artifact_lock:
+        _artifact_cache.clear()
+        _derived_cache.clear()
+        _array_cache.clear()
+        _failed_files.clear()
+
+
+def _load_derived(name, build, data_folder=None, store_folder=None, source=load_cube):
+    """`build(source)` for the current source (the cube), rebuilt only when the source is reloaded."""
+    base = source(data_folder, store_folder)
+    key = (name, data_folder or DATA_FOLDER, store_folder or STORE_FOLDER)
+    with _artifact_lock:
+        cached = _derived_cache.get(key)
+    if cached is not None and cached[0] is base:
+        return cached[1]
+    with _build_lock(("derived",) + key):
+        with _artifact_lock:
+            cached = _derived_cache.get(key)
+        if cached is not None and cached[0] is base:
+            return cached[1]
+        derived = build(base)
+        with _artifact_lock:
+            _derived_cache[key] = (base, derived)
+        return derived
+
+
+# ----------------------------------------------
+# Gas pivot
+# ----------------------------------------------
+
+def gas_pivot(cube):
+    """The cube keyed by PIVOT_KEYS with one total_emission column per gas present.
+
+    Cube keys are unique, so this is a single unstack of the gas level; a gas
+    missing for some key is 0.
+    """
+    with timed("pivot"):
+        pivot = (
+            cube.set_index(PIVOT_KEYS + ["gas"])["total_emission"]
+            .unstack("gas", fill_value=0.0)
+        )
+        pivot = pivot[[gas for gas in GASES if gas in pivot.columns]]
+        pivot.columns = list(pivot.columns)
+        return pivot.reset_index()
+
+
+def load_gas_pivot(data_folder=None, store_folder=None):
+    if USE_ARRAYS:
+        table = load_array_table("pivot", data_folder, store_folder)
+        if table is not None:
+            return table
+    return _load_derived("pivot", gas_pivot, data_folder, store_folder)
+
+
+def pivot_gases(pivot):
+    return [gas for gas in GASES if gas in pivot.columns]
+
+
+def rollup_gases(rollup):
+    """Gases with rows in a gas-keyed rollup such as the monthly one, in GASES order."""
+    present = set(cube_sum(rollup, ["gas"])["gas"].astype(str))
+    return [gas for gas in GASES if gas in present]
+
+
+# ----------------------------------------------
+# Memory-mapped array tables
+# ----------------------------------------------
+
+# name -> (artifact it is written from, transform, keys); the other columns are values
+ARRAY_TABLES = {
+    "pivot": ("cube", gas_pivot, PIVOT_KEYS),
+    "monthly": ("monthly", None, MONTHLY_KEYS),
+}
+
+_array_cache = {}   # (name, data_folder, store_folder) -> ArrayFrame
+
+
+def array_folder(name, store_folder=None):
+    return os.path.join(store_folder or STORE_FOLDER, "arrays", name)
+
+
+def write_array_tables(artifact, df, sources, store_folder=None):
+    """Write the array tables derived from artifact `artifact` (its frame `df`)."""
+    for name, (source, transform, keys) in ARRAY_TABLES.items():
+        if source == artifact:
+            table = transform(df) if transform is not None else df
+            values = [column for column in table.columns if column not in keys]
+            write_arrays(table, array_folder(name, store_folder), keys, values, sources)
+
+
+def array_tables_current(artifact, sources, store_folder=None):
+    """True when every array table of `artifact` was written for `sources`."""
+    return all(read_array_sources(array_folder(name, store_folder)) == sources
+               for name, (source, _, _) in ARRAY_TABLES.items() if source == artifact)
+
+
+def load_array_table(name, data_folder=None, store_folder=None):
+    """The memory-mapped table `name` if ingest wrote it for the current files, else None."""
+    data_folder = data_folder or DATA_FOLDER
+    key = (name, data_folder, store_folder or STORE_FOLDER)
+    sources = readable_sources(data_folder)
+    with _artifact_lock:
+        table = _array_cache.get(key)
+    if table is not None and table.sources == sources:
+        return table
+    with _build_lock(("array",) + key):
+        with _artifact_lock:
+            table = _array_cache.get(key)
+        if table is not None and table.sources == sources:
+            return table
+        folder = array_folder(name, store_folder)
+        if read_array_sources(folder) != sources:
+            return None
+        with timed("map arrays", name):
+            table = ArrayFrame(folder)
+        with _artifact_lock:
+            _array_cache[key] = table
+        return table
+
+
+# ----------------------------------------------
+# Top-N locations
+# ----------------------------------------------
+
+def top_k(values, k):
+    """Positions of the k largest values, largest first, by partial selection (no full sort)."""
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(values):
+        candidates = np.argpartition(-values, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind="stable")]
+
+
+class TopLocations:
+    """Per-country, per-year location totals for ranking locations.
+
+    Totals are kept per (country, year) over all sectors and per
+    (country, year, sector), one array column per gas. A ranking only
+    partially selects each country's top n and merges those candidates,
+    which is exact because a location belongs to one country.
+    """
+
+    def __init__(self, pivot):
+        with timed("top-n index"):
+            self.gases = pivot_gases(pivot)
+            by_sector = cube_sum(pivot, ["country", "year", "sector", "location"], values=self.gases)
+            self.sectors = sorted(by_sector["sector"].unique())
+            all_sectors = (
+                by_sector.groupby(["country", "year", "location"], observed=True)[self.gases]
+                .sum()
+                .reset_index()
+                .assign(sector=None)
+            )
+            self._totals = {}   # (country, year, sector or None) -> (locations, values[location, gas])
+            for frame in (by_sector, all_sectors):
+                locations = frame["location"].astype(str).to_numpy()
+                values = frame[self.gases].to_numpy()
+                groups = frame.groupby(["country", "year", "sector"], observed=True, dropna=False).indices
+                for (country, year, sector), rows in groups.items():
+                    sector = None if pd.isna(sector) else sector
+                    self._totals[(country, int(year), sector)] = (locations[rows], values[rows])
+
+    def top(self, country_code, year, n=10, gas="ch4", sector=None):
+        """The n highest-emitting locations of one country-year as (locations, totals)."""
+        locations, values = self._totals.get((country_code, int(year), sector), (np.empty(0, dtype=object),
+                                                                                  np.empty((0, len(self.gases)))))
+        column = values[:, self.gases.index(gas)]
+        picked = top_k(column, n)
+        return locations[picked], column[picked]
+
+    def ranking(self, countries, year, n=10, gas="ch4", sector=None):
+        """Top n locations across `countries`: location, country, total_emission."""
+        countries = [countries] if isinstance(countries, str) else list(countries)
+        with timed("top-n", f"{len(countries)} countries, n={n}"):
+            tops = [self.top(country_code, year, n, gas, sector) for country_code in countries]
+            locations = np.concatenate([t[0] for t in tops]) if tops else np.empty(0, dtype=object)
+            values = np.concatenate([t[1] for t in tops]) if tops else np.empty(0)
+            owners = np.repeat(countries, [len(t[0]) for t in tops])
+            picked = top_k(values, n)
+            return pd.DataFrame({
+                "location": locations[picked],
+                "country": owners[picked],
+                "total_emission": values[picked],
+            })
+
+
+def load_top_locations(data_folder=None, store_folder=None):
+    return _load_derived("top locations", TopLocations, data_folder, store_folder, source=load_gas_pivot)
+
+
+# ----------------------------------------------
+# Year-over-year changes and monthly anomalies
+# ----------------------------------------------
+
+CHANGE_KEYS = ["country", "sector", "location"]
+# |z| at or above which a month of a series is flagged
+ANOMALY_Z = float(os.environ.get("SMAC_ANOMALY_Z", "2"))
+
+
+def aligned_array(frame, row_keys, axis_key, values):
+    """(rows, axis, array): a long frame laid out as array[row, axis position, value column].
+
+    `rows` holds the distinct `row_keys` and `axis` the distinct `axis_key`
+    values, both sorted; repeated combinations are summed and missing ones are 0.
+    """
+    groups = frame.groupby(row_keys, observed=True, sort=True, dropna=False)
+    rows = groups.size().index.to_frame(index=False)
+    axis, axis_codes = np.unique(frame[axis_key].to_numpy(), return_inverse=True)
+    array = np.zeros((len(rows), len(axis), len(values)))
+    np.add.at(array, (groups.ngroup().to_numpy(), axis_codes.reshape(-1)), frame[values].to_numpy(dtype=np.float64))
+    return rows, axis, array
+
+
+def _mask_missing_files(array, series, years, on_file):
+    """Set array[row, i] to NaN where no file for (row's country, years[i]) is in `on_file`.
+
+    Within a file a series without rows really is 0, but without the file its
+    value is unknown.
+    """
+    countries, codes = np.unique(series["country"].astype(str).to_numpy(), return_inverse=True)
+    has_file = np.array([[(country, int(year)) in on_file for year in years] for country in countries],
+                        dtype=bool).reshape(len(countries), len(years))
+    array[~has_file[codes.reshape(-1)]] = np.nan
+
+
+def _series_mask(series, countries=None, sector=None):
+    mask = np.ones(len(series), dtype=bool)
+    if countries is not None:
+        countries = [countries] if isinstance(countries, str) else list(countries)
+        mask &= series["country"].isin(countries).to_numpy()
+    if sector is not None:
+        mask &= (series["sector"] == sector).to_numpy()
+    return mask
+
+
+class YearChanges:
+    """Year-over-year change of every country × sector × location, for every gas.
+
+    Annual totals are laid out as one array [series, year, gas] and the changes
+    between consecutive years on file are a single subtraction over it, so a
+    year, gas or filter only slices the result and ranks it by top-k selection.
+    Years a country has no file for are NaN, so changes into or out of them are NaN.
+    """
+
+    def __init__(self, pivot):
+        with timed("year changes"):
+            self.gases = pivot_gases(pivot)
+            totals = cube_sum(pivot, CHANGE_KEYS + ["year"], values=self.gases)
+            self.series, years, values = aligned_array(totals, CHANGE_KEYS, "year", self.gases)
+            self.years = [int(year) for year in years]
+            on_file = cube_sum(pivot, ["country", "year"], values=self.gases)
+            _mask_missing_files(values, self.series, self.years,
+                                set(zip(on_file["country"].astype(str), on_file["year"].astype(int))))
+            self.sectors = sorted(self.series["sector"].unique())
+            self.previous, self.current = values[:, :-1], values[:, 1:]
+            self.change = self.current - self.previous
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.change_pct = np.where(self.previous != 0, 100 * self.change / self.previous, np.nan)
+
+    def previous_year(self, year):
+        """The year on file before `year` that its changes are measured from."""
+        return self.years[self.years.index(year) - 1]
+
+    def movers(self, year, gas="ch4", countries=None, sector=None, n=None):
+        """Changes into `year` from the previous year on file, biggest absolute change first.
+
+        Columns: country, sector, location, previous, total_emission, change,
+        change_pct (NaN when the previous year was 0). Series of countries
+        without a file for either year, and series without emissions in
+        either, are left out; `n` keeps only the biggest movers.
+        """
+        step = self.years.index(year) - 1 if year in self.years else -1
+        if step < 0 or gas not in self.gases:
+            return pd.DataFrame(columns=CHANGE_KEYS + ["previous", "total_emission", "change", "change_pct"])
+        g = self.gases.index(gas)
+        with timed("movers", f"{year} {gas}"):
+            previous, current = self.previous[:, step, g], self.current[:, step, g]
+            rows = np.flatnonzero(_series_mask(self.series, countries, sector) & ~np.isnan(self.change[:, step, g])
+                                  & ((previous != 0) | (current != 0)))
+            change = self.change[rows, step, g]
+            picked = rows[top_k(np.abs(change), len(rows) if n is None else n)]
+            movers = self.series.iloc[picked].reset_index(drop=True)
+            movers["previous"] = previous[picked]
+            movers["total_emission"] = current[picked]
+            movers["change"] = self.change[picked, step, g]
+            movers["change_pct"] = self.change_pct[picked, step, g]
+            return movers
+
+
+class MonthlyAnomalies:
+    """Deseasonalized z-scores of every month of every country × sector × location × gas series.
+
+    The monthly rollup is laid out as one array [series, month]. Each month is
+    compared with the series' mean for the same calendar month over the years
+    on file (`expected`), so a regular seasonal peak or a short February is not
+    an anomaly. Those residuals are scaled by the series' residual spread. All
+    of it is whole-array arithmetic. Months of a country-year without a file
+    are NaN and never flagged. A series whose months all match their expected
+    value scores 0, which includes any series with a single year on file.
+    """
+
+    def __init__(self, monthly):
+        with timed("monthly anomalies"):
+            # The rollup has one row per series and month already: lay it out as is
+            rows = cube_slice(monthly)
+            self.series, self.months, values = aligned_array(rows, CHANGE_KEYS + ["gas"], "month", ["total_emission"])
+            self.values = values[:, :, 0]
+            months = pd.DatetimeIndex(self.months)
+            on_file = set(zip(rows["country"].astype(str), pd.DatetimeIndex(rows["month"]).year))
+            _mask_missing_files(self.values, self.series, months.year, on_file)
+
+            # Calendar-month means as matrix products with a month -> calendar month one-hot
+            present = ~np.isnan(self.values)
+            calendar = (months.month.to_numpy()[:, None] == np.arange(1, 13)).astype(np.float64)
+            filled = np.where(present, self.values, 0.0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.expected = ((filled @ calendar) / (present @ calendar)) @ calendar.T
+                residual = self.values - self.expected
+                std = np.sqrt(np.nansum(residual ** 2, axis=1) / present.sum(axis=1))
+                scale = np.nansum(np.abs(self.values), axis=1) / present.sum(axis=1)
+                # Rounding noise of a series that matches its calendar means is not spread
+                flat = ~(std > 1e-9 * scale)
+                self.z = np.where(flat[:, None], np.where(present, 0.0, np.nan), residual / std[:, None])
+
+    def anomalies(self, gas="ch4", countries=None, sector=None, threshold=ANOMALY_Z, n=None):
+        """Months with |z| >= threshold, most anomalous first.
+
+        Columns: country, sector, location, month, total_emission, expected
+        (the series' mean for that calendar month), z.
+        """
+        with timed("anomalies", gas):
+            rows = np.flatnonzero(_series_mask(self.series, countries, sector)
+                                  & (self.series["gas"] == gas).to_numpy())
+            hit_rows, hit_months = np.nonzero(np.abs(self.z[rows]) >= threshold)
+            hit_rows = rows[hit_rows]
+            z = self.z[hit_rows, hit_months]
+            picked = top_k(np.abs(z), len(z) if n is None else n)
+            hit_rows, hit_months = hit_rows[picked], hit_months[picked]
+            anomalies = self.series.iloc[hit_rows][CHANGE_KEYS].reset_index(drop=True)
+            anomalies["month"] = self.months[hit_months]
+            anomalies["total_emission"] = self.values[hit_rows, hit_months]
+            anomalies["expected"] = self.expected[hit_rows, hit_months]
+            anomalies["z"] = z[picked]
+            return anomalies
+
+
+def load_year_changes(data_folder=None, store_folder=None):
+    return _load_derived("year changes", YearChanges, data_folder, store_folder, source=load_gas_pivot)
+
+
+def load_monthly_anomalies(data_folder=None, store_folder=None):
+    return _load_derived("monthly anomalies", MonthlyAnomalies, data_folder, store_folder, source=load_monthly)
+
+
+# ----------------------------------------------
+# Slicing
+# ----------------------------------------------
+
+def cube_slice(cube, **filters):
+    """Rows of the cube matching `filters`; a list value means "any of"."""
+    with timed("filter", ", ".join(sorted(k for k, v in filters.items() if v is not None))):
+        if isinstance(cube, ArrayFrame):
+            return cube.slice(**filters)
+        mask = pd.Series(True, index=cube.index)
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                mask &= cube[column].isin(list(value))
+            else:
+                mask &= cube[column] == value
+        return cube[mask]
+
+
+def cube_sum(cube, by, values="total_emission", **filters):
+    """Sum `values` columns of a cube slice grouped by `by`, with plain (non-categorical) keys."""
+    by = [by] if isinstance(by, str) else list(by)
+    # A single column name keeps the faster SeriesGroupBy path
+    values = values if isinstance(values, str) else list(values)
+    if isinstance(cube, ArrayFrame):
+        with timed("groupby", ", ".join(by) + " (arrays)"):
+            result = cube.group_sum(by, values, **filters)
+    else:
+        rows = cube_slice(cube, **filters)
+        with timed("groupby", ", ".join(by)):
+            result = (
+                rows.groupby(by, observed=True)[values]
+                .sum()
+                .reset_index()
+            )
+    plain = {column: int if column == "year" else str
+             for column in by if column == "year" or isinstance(result[column].dtype, pd.CategoricalDtype)}
+    return result.astype(plain)
+
+
+# ----------------------------------------------
+# Monthly rollup resampling
+# ----------------------------------------------
+
+RESAMPLE_FREQUENCIES = {"Monthly": "M", "Quarterly": "Q", "Annual": "Y"}
+
+
+def resample_rollup(monthly_totals, freq, by=()):
+    """Re-bucket a monthly series (`month`, `total_emission`, *by) to month/quarter/year starts."""
+    if freq == "M":
+        return monthly_totals
+    period = monthly_totals["month"].dt.to_period(freq).dt.start_time
+    return (
+        monthly_totals.assign(month=period)
+        .groupby(["month", *by], observed=True)["total_emission"]
+        .sum()
+        .reset_index()
+    )
@@ -0,0 +1,177 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – memory-mapped array tables
+# ==============================================
+# A read-only on-disk table format the dashboard aggregates without loading:
+# every key column (country, year, month, gas, sector, location, ...) is an
+# integer code array into a small dictionary, every value column a float64
+# array, each in its own .npy file opened with mmap_mode="r". Sessions, threads
+# and server processes on one host all read the same pages from the OS page
+# cache instead of holding their own pandas copies.
+#
+# Group sums combine the key codes of the filtered rows into one integer per
+# group and add values with np.bincount, so no per-row Python or pandas
+# objects are created.
+#
+#   {folder}/meta.json            keys, values, row count, sources
+#   {folder}/{key}.codes.npy      int8/16/32 codes (-1 = missing)
+#   {folder}/{key}.dict.npy       the key's distinct values, sorted
+#   {folder}/{value}.npy          float64 values
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+META_NAME = "meta.json"
+# Dense bincount over the whole key space up to this many slots (or twice the rows)
+DENSE_GROUPS = 1 << 20
+
+
+def _code_dtype(size):
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def write_arrays(df, folder, keys, values, sources):
+    """Write `df` as an array table: dictionary-encoded `keys`, float64 `values`.
+
+    Categorical keys keep their categories as the dictionary; other keys (year,
+    month) are factorized in sorted order. The folder is replaced whole.
+    """
+    tmp = folder + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    categorical = []
+    for key in keys:
+        column = df[key]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes, dictionary = column.cat.codes.to_numpy(), column.cat.categories
+            categorical.append(key)
+        else:
+            codes, dictionary = pd.factorize(column, sort=True)
+        dictionary = np.asarray(dictionary, dtype=str if pd.api.types.is_string_dtype(dictionary) else None)
+        np.save(os.path.join(tmp, f"{key}.codes.npy"), codes.astype(_code_dtype(len(dictionary))))
+        np.save(os.path.join(tmp, f"{key}.dict.npy"), dictionary)
+    for value in values:
+        np.save(os.path.join(tmp, f"{value}.npy"), df[value].to_numpy(dtype=np.float64))
+    with open(os.path.join(tmp, META_NAME), "w") as f:
+        json.dump({"rows": len(df), "keys": list(keys), "values": list(values),
+                   "categorical": categorical, "sources": sources}, f, indent=1)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+
+
+def read_array_sources(folder):
+    """The sources recorded with an array table, or None if there is none."""
+    try:
+        with open(os.path.join(folder, META_NAME)) as f:
+            return json.load(f)["sources"]
+    except FileNotFoundError:
+        return None
+
+
+class ArrayFrame:
+    """A memory-mapped array table, aggregated in place.
+
+    Stands in for a cube frame in cube_slice / cube_sum: `columns` lists keys
+    then values, slice() materializes matching rows as a DataFrame and
+    group_sum() sums values by keys without touching unselected rows.
+    """
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, META_NAME)) as f:
+            meta = json.load(f)
+        self.folder = folder
+        self.keys = meta["keys"]
+        self.values = meta["values"]
+        self.columns = self.keys + self.values
+        self.sources = meta["sources"]
+        self._rows = meta["rows"]
+        self._categorical = set(meta["categorical"])
+        self._codes = {key: np.load(os.path.join(folder, f"{key}.codes.npy"), mmap_mode="r") for key in self.keys}
+        self._values = {value: np.load(os.path.join(folder, f"{value}.npy"), mmap_mode="r") for value in self.values}
+        self._dictionaries = {key: np.load(os.path.join(folder, f"{key}.dict.npy")) for key in self.keys}
+        self._lookup = {key: {v: i for i, v in enumerate(d.tolist())} for key, d in self._dictionaries.items()}
+
+    def __len__(self):
+        return self._rows
+
+    def nbytes(self):
+        """Bytes mapped from disk (shared), not owned by this process."""
+        return sum(a.nbytes for a in (*self._codes.values(), *self._values.values()))
+
+    def _rows_matching(self, filters):
+        # Positions of rows matching every filter, or None for all rows
+        mask = None
+        for column, value in filters.items():
+            if value is None:
+                continue
+            wanted = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            lookup = self._lookup[column]
+            codes = [lookup[v] for v in wanted if v in lookup]
+            column_codes = self._codes[column]
+            hit = column_codes == codes[0] if len(codes) == 1 else np.isin(column_codes, codes)
+            mask = hit if mask is None else mask & hit
+        return None if mask is None else np.flatnonzero(mask)
+
+    def _decode(self, key, codes):
+        dictionary = self._dictionaries[key]
+        if key in self._categorical:
+            return pd.Categorical.from_codes(codes, categories=pd.Index(dictionary.tolist()))
+        return dictionary[codes]
+
+    def _take(self, array, rows):
+        return np.asarray(array) if rows is None else array[rows]
+
+    def slice(self, **filters):
+        """Matching rows as a DataFrame (categorical text keys, as in the cube frames)."""
+        rows = self._rows_matching(filters)
+        data = {key: self._decode(key, self._take(self._codes[key], rows)) for key in self.keys}
+        data.update({value: self._take(self._values[value], rows) for value in self.values})
+        return pd.DataFrame(data)
+
+    def group_sum(self, by, values, **filters):
+        """Sum `values` of matching rows by `by`, like groupby(by, observed=True)[values].sum().reset_index().
+
+        Groups come out sorted by key and rows with a missing key are dropped.
+        """
+        values = [values] if isinstance(values, str) else list(values)
+        rows = self._rows_matching(filters)
+        codes = [self._take(self._codes[key], rows).astype(np.int64) for key in by]
+        sizes = [len(self._dictionaries[key]) for key in by]
+        if codes and len(codes[0]):
+            present = np.logical_and.reduce([c >= 0 for c in codes])
+            if not present.all():
+                rows = present if rows is None else rows[present]
+                codes = [c[present] for c in codes]
+        weights = [self._take(self._values[value], rows) for value in values]
+
+        # One integer per group: the key codes in mixed radix (lexicographic = sorted)
+        span = int(np.prod(sizes, dtype=object)) if by else 1
+        n = len(codes[0]) if codes else len(self) if rows is None else len(rows)
+        if span <= max(DENSE_GROUPS, 2 * n):
+            group = np.zeros(n, dtype=np.int64)
+            for c, size in zip(codes, sizes):
+                group = group * size + c
+            slots = np.flatnonzero(np.bincount(group, minlength=span))
+            sums = [np.bincount(group, weights=w, minlength=span)[slots] for w in weights]
+            group_codes, rest = [], slots
+            for size in reversed(sizes):
+                rest, code = np.divmod(rest, size)
+                group_codes.append(code)
+            group_codes.reverse()
+        else:
+            stacked = np.stack(codes, axis=1)
+            unique, inverse = np.unique(stacked, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            sums = [np.bincount(inverse, weights=w, minlength=len(unique)) for w in weights]
+            group_codes = list(unique.T)
+
+        data = {key: self._decode(key, code) for key, code in zip(by, group_codes)}
+        # bincount of no rows is int64 even with float weights
+        data.update((value, total.astype(np.float64, copy=False)) for value, total in zip(values, sums))
+        return pd.DataFrame(data)
@@ -0,0 +1,463 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – data layer
+# ==============================================
+
+import glob
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from smac_perf import map_in_context, timed
+
+DATA_FOLDER = "data"
+STORE_FOLDER = os.environ.get("SMAC_STORE_FOLDER", "store")
+
+# Cache bounds, overridable per deployment
+CACHE_MAX_ENTRIES = int(os.environ.get("SMAC_CACHE_MAX_ENTRIES", "64"))
+CACHE_MAX_MB = float(os.environ.get("SMAC_CACHE_MAX_MB", "512"))
+FILE_PATTERN = re.compile(r"^([A-Z]{3})_(\d{4})\.csv$")
+LOAD_WORKERS = int(os.environ.get("SMAC_LOAD_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Store total_emission as float32 in loaded frames (halves that column, ~7 significant digits)
+FLOAT32_EMISSIONS = os.environ.get("SMAC_FLOAT32", "0") == "1"
+
+country_name_map = {
+    "ARG": "Argentina", "BRA": "Brazil", "CAN": "Canada", "DEU": "Germany",
+    "ESP": "Spain", "IND": "India", "KOR": "South Korea", "MEX": "Mexico",
+    "NGA": "Nigeria", "USA": "United States", "ZAF": "South Africa"
+}
+
+# Sector mapping
+sector_map = {
+    "electricity-generation": "power", "solid-fuel-transformation": "power",
+    "heat-plants": "power", "cement": "manufacturing", "chemicals": "manufacturing",
+    "aluminum": "manufacturing", "iron-and-steel": "manufacturing", "glass": "manufacturing",
+    "lime": "manufacturing", "food-beverage-tobacco": "manufacturing", "wood-and-wood-products": "manufacturing",
+    "pulp-and-paper": "manufacturing", "textiles-leather-apparel": "manufacturing", "other-manufacturing": "manufacturing",
+    "petrochemical-steam-cracking": "manufacturing", "other-chemicals": "manufacturing", "other-metals": "manufacturing",
+    "road-transportation": "transportation", "domestic-aviation": "transportation", "international-aviation": "transportation",
+    "railways": "transportation", "other-transport": "transportation", "domestic-shipping": "transportation",
+    "international-shipping": "transportation", "crop-residues": "agriculture", "cropland-fires": "agriculture",
+    "rice-cultivation": "agriculture", "synthetic-fertilizer-application": "agriculture", "other-agricultural-soil-emissions": "agriculture",
+    "enteric-fermentation-cattle-pasture": "agriculture", "enteric-fermentation-cattle-operation": "agriculture",
+    "enteric-fermentation-other": "agriculture", "manure-left-on-pasture-cattle": "agriculture",
+    "manure-management-cattle-operation": "agriculture", "manure-management-other": "agriculture",
+    "manure-applied-to-soils": "agriculture", "coal-mining": "fossil-fuel-operations", "oil-and-gas-production": "fossil-fuel-operations",
+    "oil-and-gas-transport": "fossil-fuel-operations", "oil-and-gas-refining": "fossil-fuel-operations",
+    "other-fossil-fuel-operations": "fossil-fuel-operations", "solid-waste-disposal": "waste",
+    "biological-treatment-of-solid-waste-and-biogenic": "waste", "incineration-and-open-burning-of-waste": "waste",
+    "domestic-wastewater-treatment-and-discharge": "waste", "industrial-wastewater-treatment-and-discharge": "waste",
+    "forest-land-clearing": "land-use-change", "forest-land-degradation": "land-use-change", "forest-land-fires": "land-use-change",
+    "net-forest-land": "land-use-change", "net-shrubgrass": "land-use-change", "net-wetland": "land-use-change",
+    "wetland-fires": "land-use-change", "shrubgrass-fires": "land-use-change", "removals": "land-use-change",
+    "water-reservoirs": "land-use-change", "bauxite-mining": "mineral-extraction", "copper-mining": "mineral-extraction",
+    "iron-mining": "mineral-extraction", "sand-quarrying": "mineral-extraction", "rock-quarrying": "mineral-extraction",
+    "other-mining-quarrying": "mineral-extraction", "fluorinated-gases": "fluorinated-gases",
+    "residential-onsite-fuel-usage": "other-energy-use", "non-residential-onsite-fuel-usage": "other-energy-use",
+    "other-onsite-fuel-usage": "other-energy-use", "other-energy-use": "other-energy-use"
+}
+
+# Shared vocabularies: every loaded frame uses the same categories, so frames
+# concatenate without falling back to object columns
+GASES = ["ch4", "co2", "co2e_100yr", "co2e_20yr", "n2o"]
+SECTOR_DTYPE = pd.CategoricalDtype(sorted(sector_map))
+GAS_DTYPE = pd.CategoricalDtype(GASES)
+COUNTRY_DTYPE = pd.CategoricalDtype(sorted(country_name_map))
+SHARED_DTYPES = {
+    "original_inventory_sector": SECTOR_DTYPE,
+    "gas": GAS_DTYPE,
+    "iso3_country": COUNTRY_DTYPE,
+}
+GAS_LABELS = {
+    "ch4": "CH₄",
+    "co2": "CO₂",
+    "co2e_100yr": "CO₂e (100-yr)",
+    "co2e_20yr": "CO₂e (20-yr)",
+    "n2o": "N₂O",
+}
+# 100-year / 20-year global warming potentials behind the co2e rows (the shipped
+# co2e_20yr rows are co2 + 81.2 × ch4 + 273 × n2o)
+GWP_100 = {"ch4": 29.8, "n2o": 273.0}
+GWP_20 = {"ch4": 81.2, "n2o": 273.0}
+# Constant within a {ISO3}_{YEAR}.csv file, so dropped from loaded frames
+REDUNDANT_COLUMNS = ["iso3_country", "year"]
+
+
+def map_sector(original_inventory_sector):
+    """Map subsectors to their sector ('other' when unmapped); accepts str or categorical."""
+    series = original_inventory_sector
+    with timed("map sectors", f"{len(series)} rows"):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Map each category once and expand through the codes (-1/NaN picks the trailing 'other')
+            lookup = np.array([sector_map.get(c, "other") for c in series.cat.categories] + ["other"], dtype=object)
+            return pd.Series(lookup[series.cat.codes.to_numpy()], index=series.index, name=series.name)
+        return series.map(sector_map).fillna("other")
+
+
+def country_year_path(country_code, year, folder=None):
+    return os.path.join(folder or DATA_FOLDER, f"{country_code}_{year}.csv")
+
+
+def store_path(country_code, year, store_folder=None):
+    return os.path.join(store_folder or STORE_FOLDER, f"{country_code}_{year}.parquet")
+
+
+def discover_csv_files(data_folder=None):
+    """Yield (country_code, year, path) for every {ISO3}_{YEAR}.csv in the folder."""
+    for path in sorted(glob.glob(os.path.join(data_folder or DATA_FOLDER, "*.csv"))):
+        match = FILE_PATTERN.match(os.path.basename(path))
+        if match:
+            yield match.group(1), int(match.group(2)), path
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file – changes whenever the file is replaced or edited."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# ----------------------------------------------
+# Process-wide LRU cache of parsed country-year files
+# ----------------------------------------------
+
+class DataFrameCache:
+    """Thread-safe LRU cache shared by every Streamlit session in the process.
+
+    Entries are keyed on (country, year, folder) and remember the file signature they
+    were parsed from, so a revised CSV only invalidates its own entry.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=int(CACHE_MAX_MB * 1024 ** 2)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # (country, year, folder) -> (signature, df, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == signature:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                # File changed on disk – drop only this entry
+                self._drop(key)
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, signature, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (signature, df, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "megabytes": round(self._bytes / 1024 ** 2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+data_cache = DataFrameCache()
+
+
+def _cached(key, path, reader):
+    signature = file_signature(path)
+    df = data_cache.get(key, signature)
+    if df is None:
+        df = reader(path)
+        data_cache.put(key, signature, df)
+    # Shallow copy: callers may add columns without touching the cached entry
+    return df.copy(deep=False)
+
+
+# ----------------------------------------------
+# Columnar store: one Parquet file per country-year
+# ----------------------------------------------
+# Text columns are dictionary-encoded, dates are real UTC timestamps and every
+# gas lives in its own row group, so a CH₄-only read skips the other gases.
+# Each file records the signature its CSV had when it was converted and is
+# only used while the CSV still has exactly that signature, so a revision that
+# keeps an older mtime (cp -p, rsync -t, archive extraction) is never missed.
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+STORE_SCHEMA = pa.schema([
+    ("iso3_country", pa.dictionary(pa.int8(), pa.string())),
+    ("start_time", pa.timestamp("s", tz="UTC")),
+    ("end_time", pa.timestamp("s", tz="UTC")),
+    ("original_inventory_sector", pa.dictionary(pa.int16(), pa.string())),
+    ("gas", pa.dictionary(pa.int8(), pa.string())),
+    ("location", pa.dictionary(pa.int32(), pa.string())),
+    ("total_emission", pa.float64()),
+    ("year", pa.int16()),
+])
+SOURCE_SIGNATURE_KEY = b"smac_source_signature"
+
+_store_sources = {}   # parquet path -> (its signature, source CSV signature recorded in it)
+_store_sources_lock = threading.Lock()
+
+
+def store_schema(csv_path):
+    """STORE_SCHEMA stamped with `csv_path`'s current signature."""
+    signature = json.dumps(list(file_signature(csv_path))).encode()
+    return STORE_SCHEMA.with_metadata({SOURCE_SIGNATURE_KEY: signature})
+
+
+def convert_csv_to_store(csv_path, parquet_path):
+    """Write one country-year CSV as a typed, zstd-compressed Parquet file."""
+    # Signature first: a CSV replaced while it is read then no longer matches
+    schema = store_schema(csv_path)
+    df = pd.read_csv(csv_path)
+    for col in ("start_time", "end_time"):
+        df[col] = pd.to_datetime(df[col], format=TIME_FORMAT, utc=True)
+    df = df.sort_values(["gas", "original_inventory_sector", "location", "start_time"], kind="stable")
+
+    os.makedirs(os.path.dirname(parquet_path) or ".", exist_ok=True)
+    tmp_path = parquet_path + ".tmp"
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for _, gas_df in df.groupby("gas", sort=True):
+            writer.write_table(pa.Table.from_pandas(gas_df, schema=STORE_SCHEMA, preserve_index=False))
+    os.replace(tmp_path, parquet_path)
+    return len(df)
+
+
+def store_source_signature(parquet_path):
+    """The [mtime_ns, size] of the CSV a store file was converted from (None if unrecorded)."""
+    signature = file_signature(parquet_path)
+    with _store_sources_lock:
+        cached = _store_sources.get(parquet_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    recorded = (pq.read_schema(parquet_path).metadata or {}).get(SOURCE_SIGNATURE_KEY)
+    source = json.loads(recorded) if recorded else None
+    with _store_sources_lock:
+        _store_sources[parquet_path] = (signature, source)
+    return source
+
+
+def store_is_fresh(csv_path, parquet_path):
+    """True if the store file exists and was converted from the CSV exactly as it is now."""
+    if not os.path.exists(parquet_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return store_source_signature(parquet_path) == list(file_signature(csv_path))
+
+
+def restamp_store(parquet_path, csv_path):
+    """Record `csv_path`'s current signature in a store file whose content still matches it."""
+    source = pq.ParquetFile(parquet_path)
+    tmp_path = parquet_path + ".tmp"
+    with pq.ParquetWriter(tmp_path, store_schema(csv_path), compression="zstd") as writer:
+        # Row group by row group, so every gas keeps its own row group; Parquet
+        # hands second timestamps back as milliseconds, hence the cast
+        for i in range(source.num_row_groups):
+            writer.write_table(source.read_row_group(i).cast(STORE_SCHEMA))
+    source.close()
+    os.replace(tmp_path, parquet_path)
+
+
+def _read_store(path, columns, gas):
+    if columns is not None:
+        columns = list(columns) + (["gas"] if gas is not None and "gas" not in columns else [])
+    filters = [("gas", "=", gas)] if gas is not None else None
+    # Dictionary columns arrive as categoricals and are recoded to the shared vocabularies
+    return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+
+
+# ----------------------------------------------
+# Compact in-memory schema
+# ----------------------------------------------
+
+def _to_shared_category(series, dtype):
+    extra = pd.Index(series.dropna().unique()).difference(dtype.categories)
+    if len(extra):
+        # Values outside the shared vocabulary (e.g. a new subsector) are appended
+        dtype = pd.CategoricalDtype(dtype.categories.append(extra.astype(dtype.categories.dtype)))
+    return series.astype(dtype)
+
+
+def compact_frame(df, float32=FLOAT32_EMISSIONS):
+    """Return `df` in the loader's compact schema.
+
+    Drops columns implied by the file name, stores text as categoricals (shared
+    vocabularies for subsector, gas and country), parses dates with the fixed
+    format and optionally downcasts total_emission to float32.
+    """
+    df = df.drop(columns=REDUNDANT_COLUMNS, errors="ignore")
+    for column in df.columns:
+        if column in SHARED_DTYPES:
+            df[column] = _to_shared_category(df[column], SHARED_DTYPES[column])
+        elif column == "location" and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+        elif column in ("start_time", "end_time") and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], format=TIME_FORMAT, utc=True, cache=True)
+    if float32 and "total_emission" in df.columns:
+        df["total_emission"] = df["total_emission"].astype("float32")
+    return df
+
+
+def month_start(times):
+    """Month of each timestamp as tz-naive datetime64 month starts, fully vectorized.
+
+    Accepts parsed timestamps or the raw fixed-format strings ("2021-01-01T00:00:00Z");
+    strings are cut to "YYYY-MM" and parsed by NumPy, once per distinct value when
+    categorical, instead of going through pandas' format inference.
+    """
+    if pd.api.types.is_datetime64_any_dtype(times):
+        if getattr(times.dt, "tz", None) is not None:
+            times = times.dt.tz_convert(None)
+        values = times.to_numpy().astype("datetime64[M]")
+    elif isinstance(times.dtype, pd.CategoricalDtype):
+        months = np.array(times.cat.categories.astype(str).str[:7], dtype="datetime64[M]")
+        values = np.append(months, np.datetime64("NaT", "M"))[times.cat.codes.to_numpy()]
+    else:
+        values = np.array(times.astype(str).str[:7], dtype="datetime64[M]")
+    return pd.Series(values.astype("datetime64[s]"), index=times.index, name="month")
+
+
+def memory_report(raw, compact):
+    """Per-column bytes of a raw frame next to its compact form."""
+    report = pd.DataFrame({
+        "raw_bytes": raw.memory_usage(deep=True, index=False),
+        "compact_bytes": compact.memory_usage(deep=True, index=False),
+    }).fillna(0).astype("int64")
+    report.loc["total"] = report.sum()
+    report["saved_pct"] = (100 * (1 - report["compact_bytes"] / report["raw_bytes"])).round(1)
+    return report
+
+
+def read_country_year(country_code, year, columns=None, gas=None, folder=None, store_folder=None,
+                      float32=FLOAT32_EMISSIONS):
+    """Load one country-year in the compact schema, preferring the Parquet store.
+
+    `columns` and `gas` narrow the read; with the store only those columns and the
+    matching row groups are read from disk, otherwise the CSV is parsed once and
+    cached. Raises FileNotFoundError if neither exists.
+    """
+    with timed("load", f"{country_code} {year}"):
+        return _read_country_year(country_code, year, columns, gas, folder, store_folder, float32)
+
+
+def _read_country_year(country_code, year, columns, gas, folder, store_folder, float32):
+    folder = folder or DATA_FOLDER
+    csv_path = country_year_path(country_code, year, folder)
+    parquet_path = store_path(country_code, year, store_folder)
+    columns = tuple(columns) if columns is not None else None
+
+    if store_is_fresh(csv_path, parquet_path):
+        key = (country_code, int(year), parquet_path, columns, gas, float32)
+        return _cached(key, parquet_path, lambda path: compact_frame(_read_store(path, columns, gas), float32))
+
+    key = (country_code, int(year), csv_path, float32)
+    df = _cached(key, csv_path, lambda path: compact_frame(pd.read_csv(path), float32))
+    if gas is None and columns is None:
+        return df
+    with timed("filter", f"gas == {gas}"):
+        rows = df["gas"] == gas if gas is not None else slice(None)
+        cols = [c for c in df.columns if c in columns or c == "gas"] if columns is not None else slice(None)
+        return df.loc[rows, cols].copy()
+
+
+# ----------------------------------------------
+# Bulk multi-file loader
+# ----------------------------------------------
+
+def load_country_years(pairs, columns=None, gas=None, folder=None, store_folder=None,
+                       max_workers=LOAD_WORKERS):
+    """Load many (country, year) files concurrently and concatenate them once.
+
+    Returns (df, missing): `df` carries categorical `country` and `year` columns and
+    `missing` lists the (country, year) pairs that have no file.
+    """
+    pairs = list(dict.fromkeys((country, int(year)) for country, year in pairs))
+
+    def load(pair):
+        try:
+            return read_country_year(pair[0], pair[1], columns=columns, gas=gas,
+                                     folder=folder, store_folder=store_folder)
+        except FileNotFoundError:
+            return None
+
+    if max_workers > 1 and len(pairs) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as pool:
+            results = map_in_context(pool, load, pairs)
+    else:
+        results = [load(pair) for pair in pairs]
+
+    missing = [pair for pair, df in zip(pairs, results) if df is None]
+    loaded = [(pair, df) for pair, df in zip(pairs, results) if df is not None and not df.empty]
+    if not loaded:
+        return pd.DataFrame(), missing
+
+    frames = [df.drop(columns=["country", "year"], errors="ignore") for _, df in loaded]
+    _unify_categories(frames, "location")
+    combined = pd.concat(frames, ignore_index=True)
+
+    # Tag every row with its file's country/year by repeating per-file codes
+    lengths = [len(df) for df in frames]
+    countries = list(COUNTRY_DTYPE.categories)
+    countries += [c for c in dict.fromkeys(pair[0] for pair, _ in loaded) if c not in countries]
+    years = sorted({pair[1] for pair, _ in loaded})
+    country_codes = np.repeat([countries.index(pair[0]) for pair, _ in loaded], lengths)
+    year_codes = np.repeat([years.index(pair[1]) for pair, _ in loaded], lengths)
+    combined["country"] = pd.Categorical.from_codes(country_codes, categories=countries)
+    combined["year"] = pd.Categorical.from_codes(year_codes, categories=years, ordered=True)
+    return combined, missing
+
+
+def _unify_categories(frames, column):
+    # Give every frame's per-file categorical the union of categories so concat keeps it
+    if not all(column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+        return
+    dtype = union_categoricals([df[column].array for df in frames], ignore_order=True).dtype
+    for i, df in enumerate(frames):
+        frames[i] = df.assign(**{column: df[column].astype(dtype)})
+
+
+if __name__ == "__main__":
+    # Memory report: raw CSV frame vs the loader's compact schema, per file
+    for country_code, year, path in discover_csv_files():
+        raw = pd.read_csv(path)
+        print(f"{country_code} {year}")
+        print(memory_report(raw, compact_frame(raw)).to_string(), end="\n\n")
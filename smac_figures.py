@@ -0,0 +1,235 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – figure cache
+# ==============================================
+# Plotly figures are cached as the JSON Streamlit sends to the browser, keyed
+# on the figure function, the data slice it was given and its options. A hit
+# skips plotly.express entirely and is not re-validated.
+#
+# Optional payload trimming (SMAC_TRIM_PAYLOAD=1, or ?lite=1 in the app) folds
+# pie slices below SMAC_TRIM_MIN_SHARE into "Other", rounds plotted values to
+# a few significant digits and replaces plotly's default template (restyled
+# by the Streamlit theme anyway) with its colour sequence alone.
+#
+# Cache entries can be written to a snapshot file and read back into a fresh
+# process (smac_startup does this for the default view). Keys include a digest
+# of each figure's data, so an entry for data that has since changed is never
+# served.
+#
+#   SMAC_FIGURE_CACHE_MB   serialized figures kept per process (default 64)
+
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+FIGURE_CACHE_MB = float(os.environ.get("SMAC_FIGURE_CACHE_MB", "64"))
+TRIM_PAYLOAD = os.environ.get("SMAC_TRIM_PAYLOAD", "0") == "1"
+TRIM_MIN_SHARE = float(os.environ.get("SMAC_TRIM_MIN_SHARE", "0.01"))
+TRIM_DIGITS = 6
+OTHER_LABEL = "Other"
+
+_trim = contextvars.ContextVar("smac_trim_payload", default=TRIM_PAYLOAD)
+
+
+def set_trim(enabled):
+    """Turn payload trimming on or off for figures built in the current context (one rerun)."""
+    _trim.set(bool(enabled))
+
+
+# ----------------------------------------------
+# Cache
+# ----------------------------------------------
+
+class SerializedFigure(go.Figure):
+    """A figure restored from cached JSON.
+
+    Only the title is a real attribute; to_dict() returns the cached spec, so
+    st.plotly_chart and plotly.io serialize it without rebuilding the traces.
+    """
+
+    def __init__(self, spec_json):
+        spec = json.loads(spec_json)
+        super().__init__(layout={"title": spec.get("layout", {}).get("title", {})})
+        self._spec_json = spec_json
+
+    def to_dict(self):
+        return json.loads(self._spec_json)
+
+
+class FigureCache:
+    """Thread-safe LRU of serialized figures, bounded by their total size."""
+
+    def __init__(self, max_bytes=int(FIGURE_CACHE_MB * 1024 ** 2)):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> spec JSON
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            spec_json = self._entries.get(key)
+            if spec_json is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return spec_json
+
+    def put(self, key, spec_json):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            if len(spec_json) > self.max_bytes:
+                return
+            self._entries[key] = spec_json
+            self._bytes += len(spec_json)
+            while self._bytes > self.max_bytes:
+                _, oldest = self._entries.popitem(last=False)
+                self._bytes -= len(oldest)
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "kilobytes": round(self._bytes / 1024, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+figure_cache = FigureCache()
+
+
+def _digest(value):
+    """A hashable cache key part for a figure argument; frames are hashed by content."""
+    if isinstance(value, pd.DataFrame):
+        content = pd.util.hash_pandas_object(value, index=False).to_numpy()
+        return ("frame", tuple(value.columns), len(value), hashlib.blake2b(content.tobytes(), digest_size=16).hexdigest())
+    if isinstance(value, dict):
+        return tuple(sorted((k, _digest(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_digest(v) for v in value)
+    return value
+
+
+def cached_figure(fn):
+    """Decorator: serve fn's figure from `figure_cache` when called with the same data and options."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        trim = _trim.get()
+        # The default template (Streamlit installs its own) is baked into the built figure
+        key = (fn.__name__, trim, pio.templates.default, _digest(args), _digest(kwargs))
+        spec_json = figure_cache.get(key)
+        if spec_json is not None:
+            return SerializedFigure(spec_json)
+        fig = fn(*args, **kwargs)
+        if trim:
+            trim_figure(fig)
+        fig._spec_json = pio.to_json(fig, validate=False)
+        figure_cache.put(key, fig._spec_json)
+        return fig
+    return wrapper
+
+
+def payload_bytes(fig):
+    """Size of the JSON serialized for a cached figure (None for a figure the cache never saw)."""
+    spec_json = getattr(fig, "_spec_json", None)
+    return None if spec_json is None else len(spec_json)
+
+
+# ----------------------------------------------
+# Snapshots
+# ----------------------------------------------
+
+def _as_key(value):
+    # JSON turns the key's tuples into lists; turn them back so the key hashes again
+    return tuple(_as_key(v) for v in value) if isinstance(value, list) else value
+
+
+def write_figure_snapshot(path, entries=None, **extra):
+    """Write cache entries (default: all of `figure_cache`) and `extra` fields to a JSON file."""
+    entries = figure_cache.items() if entries is None else entries
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({**extra, "figures": [[key, spec_json] for key, spec_json in entries]}, f,
+                  default=lambda o: o.item())
+    os.replace(path + ".tmp", path)
+
+
+def read_figure_snapshot(path):
+    """(extra fields, [(key, spec JSON)]) of a snapshot file."""
+    with open(path) as f:
+        snapshot = json.load(f)
+    entries = [(_as_key(key), spec_json) for key, spec_json in snapshot.pop("figures")]
+    return snapshot, entries
+
+
+# ----------------------------------------------
+# Payload trimming
+# ----------------------------------------------
+
+def round_significant(values, digits=TRIM_DIGITS):
+    """Round to `digits` significant digits, elementwise (zeros and NaN pass through)."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    magnitude = np.where(np.isfinite(magnitude), magnitude, 0)
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+def _fold_pie(trace, min_share):
+    values = np.asarray(trace.values, dtype=float)
+    total = values.sum()
+    if not total or len(values) < 3:
+        return
+    small = values / total < min_share
+    if small.sum() < 2:
+        return
+    labels = np.asarray(trace.labels, dtype=object)
+    trace.labels = list(labels[~small]) + [OTHER_LABEL]
+    trace.values = np.append(values[~small], values[small].sum())
+    if isinstance(trace.pull, (list, tuple)):
+        pull = np.asarray(trace.pull, dtype=float)
+        trace.pull = list(pull[~small]) + [pull[small].max()]
+
+
+def trim_figure(fig, min_share=TRIM_MIN_SHARE, digits=TRIM_DIGITS):
+    """Shrink a figure's payload in place: fold small pie slices, round values, slim the template."""
+    for trace in fig.data:
+        if trace.type == "pie":
+            _fold_pie(trace, min_share)
+        for attribute in ("x", "y", "values", "lat", "lon"):
+            data = getattr(trace, attribute, None)
+            if data is not None and np.issubdtype(np.asarray(data).dtype, np.number):
+                setattr(trace, attribute, round_significant(data, digits))
+        marker = getattr(trace, "marker", None)
+        if marker is not None:
+            for attribute in ("size", "color"):
+                data = getattr(marker, attribute, None)
+                if data is not None and not isinstance(data, str) and np.issubdtype(np.asarray(data).dtype, np.number):
+                    setattr(marker, attribute, round_significant(data, digits))
+    colorway = fig.layout.template.layout.colorway
+    fig.layout.template = go.layout.Template(layout={"colorway": colorway})
+    return fig
@@ -0,0 +1,96 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – data manifest
+# ==============================================
+# store/manifest.json records every {ISO3}_{YEAR}.csv under the data folder:
+# its signature (mtime, size), content hash, row count and columns. ingest.py
+# uses it to convert only new or revised files; the dashboard takes its
+# country and year selectors from it.
+
+import hashlib
+import json
+import os
+
+import pyarrow.parquet as pq
+
+from smac_data import STORE_FOLDER, discover_csv_files, file_signature
+
+MANIFEST_NAME = "manifest.json"
+
+
+def manifest_path(store_folder=None):
+    return os.path.join(store_folder or STORE_FOLDER, MANIFEST_NAME)
+
+
+def read_manifest(store_folder=None):
+    """{file name: entry} as last written by ingest, or {} before the first ingest."""
+    try:
+        with open(manifest_path(store_folder)) as f:
+            return json.load(f)["files"]
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(entries, store_folder=None):
+    path = manifest_path(store_folder)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"files": dict(sorted(entries.items()))}, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def csv_columns(path):
+    with open(path, encoding="utf-8") as f:
+        return f.readline().strip().split(",")
+
+
+def manifest_entry(country_code, year, csv_path, sha256=None, rows=None):
+    return {
+        "country": country_code,
+        "year": int(year),
+        "signature": list(file_signature(csv_path)),
+        "sha256": sha256,
+        "rows": rows,
+        "columns": csv_columns(csv_path),
+    }
+
+
+def parquet_rows(parquet_path):
+    return pq.read_metadata(parquet_path).num_rows
+
+
+def current_manifest(data_folder=None, store_folder=None):
+    """Entries for the files on disk now.
+
+    Recorded entries are kept while the file's signature matches; files that are
+    new or changed since the last ingest get an entry without hash or row count.
+    """
+    recorded = read_manifest(store_folder)
+    entries = {}
+    for country_code, year, path in discover_csv_files(data_folder):
+        name = os.path.basename(path)
+        entry = recorded.get(name)
+        if entry is None or entry["signature"] != list(file_signature(path)):
+            entry = {"country": country_code, "year": year, "signature": list(file_signature(path)),
+                     "sha256": None, "rows": None, "columns": None}
+        entries[name] = entry
+    return entries
+
+
+def manifest_years(entries):
+    return sorted({entry["year"] for entry in entries.values()})
+
+
+def manifest_countries(entries):
+    return sorted({entry["country"] for entry in entries.values()})
+
+
+def manifest_pairs(entries):
+    return {(entry["country"], entry["year"]) for entry in entries.values()}
@@ -0,0 +1,106 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – performance instrumentation
+# ==============================================
+# Lightweight timers around the dashboard's hot paths (file loads, gas filter,
+# sector mapping, groupbys, figure builds, chart serialization). Timings are
+# collected per rerun only while a run is active, so the hooks cost a single
+# ContextVar lookup otherwise.
+#
+#   SMAC_PERF=1            show the diagnostics panel for every session (or ?perf=1)
+#   SMAC_PERF_LOG=path     append one JSON line per rerun to this file
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PERF_ENABLED = os.environ.get("SMAC_PERF", "0") == "1"
+PERF_LOG = os.environ.get("SMAC_PERF_LOG")
+
+_current_run = contextvars.ContextVar("smac_perf_run", default=None)
+_log_lock = threading.Lock()
+
+
+class PerfRun:
+    """Timings of one rerun of one tab."""
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.total_ms = None
+        self.records = []   # dicts: stage, label, ms (+ extra fields such as bytes)
+
+    def add(self, stage, label, ms, **extra):
+        self.records.append({"stage": stage, "label": label, "ms": round(ms, 3), **extra})
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self._start) * 1000, 3)
+
+    def stage_totals(self):
+        totals = {}
+        for record in self.records:
+            entry = totals.setdefault(record["stage"], {"stage": record["stage"], "calls": 0, "ms": 0.0})
+            entry["calls"] += 1
+            entry["ms"] = round(entry["ms"] + record["ms"], 3)
+        return sorted(totals.values(), key=lambda e: e["ms"], reverse=True)
+
+    def as_dict(self):
+        return {"tab": self.tab, "started": self.started, "total_ms": self.total_ms,
+                "stages": self.stage_totals(), "records": self.records}
+
+
+def start_run(tab):
+    run = PerfRun(tab)
+    _current_run.set(run)
+    return run
+
+
+def finish_run(run, log_path=PERF_LOG):
+    """Close the run and append it to `log_path` as one JSON line, if set."""
+    run.finish()
+    _current_run.set(None)
+    if log_path:
+        line = json.dumps(run.as_dict())
+        with _log_lock, open(log_path, "a") as f:
+            f.write(line + "\n")
+    return run
+
+
+def current_run():
+    return _current_run.get()
+
+
+@contextmanager
+def timed(stage, label=None):
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add(stage, label, (time.perf_counter() - start) * 1000)
+
+
+def instrument(stage):
+    """Decorator: time every call of the function under `stage`, labelled by its name."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_run.get() is None:
+                return fn(*args, **kwargs)
+            with timed(stage, fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def map_in_context(pool, fn, items):
+    """pool.map that carries the caller's active run into the worker threads."""
+    futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
@@ -0,0 +1,339 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – SQLite query backend
+# ==============================================
+# An optional embedded database for slices the tabs do not offer: one sector
+# across every country and year, every location whose name matches, and so on.
+# It holds every monthly row of every {ISO3}_{YEAR}.csv, with a composite index
+# on (country, year, gas, sector, location) and a smaller one for sector-first
+# lookups, so a query reads only the matching rows instead of scanning every
+# CSV. A location match (text anywhere in the name) cannot use an index and
+# checks the rows the other filters leave. Rows go from csv to sqlite3 and back
+# without ever becoming DataFrames.
+#
+# Like the store it is updated per file: a rerun only reloads files whose
+# signature changed and drops the rows of deleted files. Reads use their own
+# read-only connections, so an update never blocks the dashboard.
+#
+#   python smac_query.py build                          # or: python ingest.py --sqlite
+#   python smac_query.py export --sector power -o power.csv
+#   python smac_query.py export --location-match cape --gas ch4 -o cape.csv
+#
+#   SMAC_QUERY_DB   database path (default: store/emissions.sqlite)
+
+import csv
+import io
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from smac_data import DATA_FOLDER, STORE_FOLDER, discover_csv_files, file_signature, sector_map
+
+QUERY_DB = os.environ.get("SMAC_QUERY_DB")
+DB_NAME = "emissions.sqlite"
+# Rows per fetchmany / executemany batch: bounds memory on export and build
+CHUNK_ROWS = 50_000
+
+COLUMNS = ["country", "year", "start_time", "end_time", "gas", "sector",
+           "original_inventory_sector", "location", "total_emission"]
+FILTER_COLUMNS = ["country", "year", "gas", "sector", "original_inventory_sector", "location"]
+# CSV columns read into the table; country and year come from the file name
+SOURCE_COLUMNS = ["start_time", "end_time", "original_inventory_sector", "gas", "location", "total_emission"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emissions (
+    country TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    start_time TEXT,
+    end_time TEXT,
+    gas TEXT,
+    sector TEXT,
+    original_inventory_sector TEXT,
+    location TEXT,
+    total_emission REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    country TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    rows INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vocabulary (
+    name TEXT NOT NULL,
+    value,
+    PRIMARY KEY (name, value)
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS emissions_country_year_gas_sector_location
+    ON emissions (country, year, gas, sector, location);
+CREATE INDEX IF NOT EXISTS emissions_sector_gas ON emissions (sector, gas, original_inventory_sector);
+DROP INDEX IF EXISTS emissions_location;
+"""
+
+
+def db_path(store_folder=None):
+    return QUERY_DB or os.path.join(store_folder or STORE_FOLDER, DB_NAME)
+
+
+def connect(path=None):
+    """A read-only connection; raises FileNotFoundError before the database is built."""
+    path = path or db_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No query database at '{path}' (python smac_query.py build)")
+    return sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+
+
+# ----------------------------------------------
+# Build
+# ----------------------------------------------
+
+def _file_rows(country_code, year, csv_path):
+    # (country, year, start, end, gas, sector, subsector, location, emission) per CSV row
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        start, end, subsector, gas, location, emission = (header.index(c) for c in SOURCE_COLUMNS)
+        for row in reader:
+            value = row[emission]
+            yield (country_code, year, row[start], row[end], row[gas],
+                   sector_map.get(row[subsector], "other"), row[subsector], row[location],
+                   float(value) if value else None)
+
+
+def _insert_file(conn, country_code, year, csv_path):
+    insert = f"INSERT INTO emissions VALUES ({', '.join('?' * len(COLUMNS))})"
+    rows = 0
+    batch = []
+    for row in _file_rows(country_code, year, csv_path):
+        batch.append(row)
+        if len(batch) == CHUNK_ROWS:
+            conn.executemany(insert, batch)
+            rows += len(batch)
+            batch.clear()
+    conn.executemany(insert, batch)
+    return rows + len(batch)
+
+
+def database_current(data_folder=None, path=None):
+    """True if the database holds exactly the CSV files on disk now, as they are."""
+    path = path or db_path()
+    if not os.path.exists(path):
+        return False
+    with closing(connect(path)) as conn:
+        recorded = {file: [mtime_ns, size] for file, mtime_ns, size in
+                    conn.execute("SELECT file, mtime_ns, size FROM files")}
+    on_disk = {os.path.basename(p): list(file_signature(p)) for _, _, p in discover_csv_files(data_folder)}
+    return recorded == on_disk
+
+
+def build_database(data_folder=None, path=None, force=False, verbose=True, skip=()):
+    """Create or update the database from the CSVs; returns {"loaded", "up to date", "removed", "skipped"} counts.
+
+    A new database is loaded without indexes and indexed once at the end; an
+    existing one replaces only changed files' rows, one transaction per file.
+    Files named in `skip` (e.g. ones ingest could not read) keep whatever rows
+    they already have.
+    """
+    path = path or db_path()
+    if force and os.path.exists(path):
+        os.remove(path)
+    fresh = not os.path.exists(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    counts = {"loaded": 0, "up to date": 0, "removed": 0, "skipped": 0}
+
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if not fresh:
+            conn.executescript(INDEXES)
+        recorded = {file: (country, year, [mtime_ns, size]) for file, country, year, mtime_ns, size
+                    in conn.execute("SELECT file, country, year, mtime_ns, size FROM files")}
+        files = list(discover_csv_files(data_folder))
+
+        for country_code, year, csv_path in files:
+            name = os.path.basename(csv_path)
+            signature = list(file_signature(csv_path))
+            if name in recorded and recorded[name][2] == signature:
+                counts["up to date"] += 1
+                continue
+            if name in skip:
+                counts["skipped"] += 1
+                continue
+            start = time.perf_counter()
+            with conn:
+                if name in recorded:
+                    conn.execute("DELETE FROM emissions WHERE country = ? AND year = ?", (country_code, year))
+                rows = _insert_file(conn, country_code, year, csv_path)
+                conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                             (name, country_code, year, *signature, rows))
+            counts["loaded"] += 1
+            if verbose:
+                print(f"  {country_code} {year}: {rows} rows ({time.perf_counter() - start:.2f}s)")
+
+        present = {os.path.basename(p) for _, _, p in files}
+        for name, (country_code, year, _) in recorded.items():
+            if name not in present:
+                with conn:
+                    conn.execute("DELETE FROM emissions WHERE country = ? AND year = ?", (country_code, year))
+                    conn.execute("DELETE FROM files WHERE file = ?", (name,))
+                counts["removed"] += 1
+                if verbose:
+                    print(f"  {country_code} {year}: removed")
+
+        if fresh or counts["loaded"] or counts["removed"]:
+            with conn:
+                conn.executescript(INDEXES)
+                # Distinct values for the filter widgets, so they never scan the table
+                conn.execute("DELETE FROM vocabulary")
+                for column in FILTER_COLUMNS:
+                    conn.execute(f"INSERT INTO vocabulary SELECT DISTINCT ?, {column} FROM emissions "
+                                 f"WHERE {column} IS NOT NULL", (column,))
+            # Index statistics let the planner pick the narrowest index per query
+            conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return counts
+
+
+# ----------------------------------------------
+# Queries
+# ----------------------------------------------
+
+def where_clause(filters, location_match=None):
+    """(SQL, parameters) for `filters` {column: value or list}; None or [] leaves a column open.
+
+    `location_match` keeps locations containing that text, ignoring case.
+    """
+    clauses, params = [], []
+    for column, value in filters.items():
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"Cannot filter on '{column}' (one of {', '.join(FILTER_COLUMNS)})")
+        if value is None:
+            continue
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if not values:
+            continue
+        if len(values) == 1:
+            clauses.append(f"{column} = ?")
+        else:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    if location_match:
+        escaped = location_match.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("location LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _columns(columns):
+    columns = list(columns or COLUMNS)
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+    return columns
+
+
+def options(column, path=None):
+    """Sorted distinct values of a filter column."""
+    if column not in FILTER_COLUMNS:
+        raise ValueError(f"No options for '{column}'")
+    with closing(connect(path)) as conn:
+        return [value for value, in conn.execute(
+            "SELECT value FROM vocabulary WHERE name = ? ORDER BY value", (column,))]
+
+
+def count_rows(path=None, location_match=None, **filters):
+    where, params = where_clause(filters, location_match)
+    with closing(connect(path)) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM emissions{where}", params).fetchone()[0]
+
+
+def group_sum(by, path=None, location_match=None, **filters):
+    """(columns, rows): total_emission of the matching rows summed by the `by` columns."""
+    by = _columns(by)
+    where, params = where_clause(filters, location_match)
+    keys = ", ".join(by)
+    with closing(connect(path)) as conn:
+        rows = conn.execute(f"SELECT {keys}, SUM(total_emission) FROM emissions{where} "
+                            f"GROUP BY {keys} ORDER BY {keys}", params).fetchall()
+    return by + ["total_emission"], rows
+
+
+def iter_rows(columns=None, path=None, chunk_rows=CHUNK_ROWS, limit=None, location_match=None, **filters):
+    """Yield the matching rows in lists of up to `chunk_rows` tuples, in file and time order."""
+    columns = _columns(columns)
+    where, params = where_clause(filters, location_match)
+    sql = f"SELECT {', '.join(columns)} FROM emissions{where} ORDER BY country, year, rowid"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    with closing(connect(path)) as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+
+
+def iter_csv(columns=None, path=None, chunk_rows=CHUNK_ROWS, location_match=None, **filters):
+    """Yield the matching rows as CSV text, header first, one chunk of rows at a time."""
+    columns = _columns(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for rows in iter_rows(columns, path, chunk_rows, location_match=location_match, **filters):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_csv(out, columns=None, path=None, chunk_rows=CHUNK_ROWS, location_match=None, **filters):
+    """Write the matching rows as CSV to a path or text file object; returns the row count."""
+    if isinstance(out, str):
+        with open(out, "w", newline="", encoding="utf-8") as f:
+            return export_csv(f, columns, path, chunk_rows, location_match, **filters)
+    columns = _columns(columns)
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns)
+    count = 0
+    for rows in iter_rows(columns, path, chunk_rows, location_match=location_match, **filters):
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Build or query the SQLite query backend.")
+    parser.add_argument("--db", default=None, help=f"database path (default: {db_path()})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="create or update the database from the CSVs")
+    build.add_argument("--data-folder", default=DATA_FOLDER)
+    build.add_argument("--force", action="store_true", help="rebuild from scratch")
+    export = commands.add_parser("export", help="write matching rows as CSV")
+    for column in FILTER_COLUMNS:
+        export.add_argument(f"--{column.replace('_', '-')}", dest=column, action="append",
+                            type=int if column == "year" else str)
+    export.add_argument("--location-match", help="locations containing this text (any case)")
+    export.add_argument("--columns", help="comma-separated output columns")
+    export.add_argument("-o", "--out", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        counts = build_database(args.data_folder, args.db, force=args.force)
+        print(f"Query database: {counts['loaded']} loaded, {counts['up to date']} up to date, "
+              f"{counts['removed']} removed in {time.perf_counter() - start:.2f}s -> {args.db or db_path()}")
+    else:
+        filters = {column: getattr(args, column) for column in FILTER_COLUMNS}
+        columns = args.columns.split(",") if args.columns else None
+        out = args.out or sys.stdout
+        rows = export_csv(out, columns, args.db, location_match=args.location_match, **filters)
+        print(f"{rows} rows", file=sys.stderr)
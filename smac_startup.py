@@ -0,0 +1,141 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – cold start
+# ==============================================
+# A fresh server process renders the default view (🌎 SMAC Group Overview, latest
+# year, first gas) from a snapshot of its figures that ingest writes next to the
+# store, so the first visitor does not wait for plotly.express. Everything else
+# is warmed in a background thread while the first page renders: the gas pivot
+# and top-N index, the monthly rollup, the default view's figures when the
+# snapshot is missing or stale, and finally the plotly.express import.
+#
+#   SMAC_PREWARM=0   no background warm-up
+#
+#   python smac_startup.py   # rewrite the snapshot (ingest does this too)
+
+import contextvars
+import os
+import threading
+import traceback
+
+import smac_figures as figures
+import smac_views as views
+from smac_aggregates import data_sources, failed_pairs, load_gas_pivot, load_monthly, load_top_locations, pivot_gases
+from smac_data import DATA_FOLDER, GAS_LABELS, STORE_FOLDER, country_name_map
+from smac_manifest import current_manifest, manifest_countries, manifest_pairs, manifest_years
+
+PREWARM = os.environ.get("SMAC_PREWARM", "1") == "1"
+SNAPSHOT_NAME = "snapshot.json"
+DEFAULT_TOP_N = 10
+
+_start_lock = threading.Lock()
+_started = set()   # (data_folder, store_folder) already started in this process
+
+
+def snapshot_path(store_folder=None):
+    return os.path.join(store_folder or STORE_FOLDER, SNAPSHOT_NAME)
+
+
+def default_overview(data_folder=None, store_folder=None):
+    """Build the default Tab 1 view's figures the way Final-test.py does, so their cache keys match."""
+    manifest = current_manifest(data_folder)
+    countries = [c for c in country_name_map if c in manifest_countries(manifest)]
+    years = manifest_years(manifest)
+    pivot = load_gas_pivot(data_folder, store_folder)
+    pairs = manifest_pairs(manifest) - failed_pairs(data_folder)
+    gases = pivot_gases(pivot)
+    if not countries or not years or not gases:
+        return
+    year, gas = years[-1], gases[0]
+
+    countries_year = [c for c in countries if (c, year) in pairs]
+    if not countries_year:
+        return
+    country_emissions = views.country_totals(pivot, countries_year, year, gas)
+    views.fig_country_map(country_emissions, year, gas)
+    pairs_all_years = [(c, y) for y in years for c in countries if (c, y) in pairs]
+    if pairs_all_years:
+        sector_time_df = views.sector_trend(
+            pivot, sorted({c for c, _ in pairs_all_years}), sorted({y for _, y in pairs_all_years}), gas)
+        views.fig_sector_trend(sector_time_df, f"{GAS_LABELS[gas]} Emissions by Sector Over Time", gas)
+    views.fig_country_pie(country_emissions, year, gas)
+    top_index = load_top_locations(data_folder, store_folder)
+    top = views.top_locations_group(top_index, countries_year, year, DEFAULT_TOP_N, gas, None)
+    views.fig_top_locations(top, year, gas, DEFAULT_TOP_N)
+
+
+def write_snapshot(data_folder=None, store_folder=None):
+    """Build the default view with and without payload trimming and write its figures.
+
+    Meant for ingest and the command line: it empties this process's figure cache
+    so that only the default view's figures are written. Returns the figure count.
+    """
+    import streamlit  # noqa: F401 – installs the plotly template the app's figures are built with
+
+    figures.figure_cache.clear()
+    for trim in (False, True):
+        context = contextvars.copy_context()
+        context.run(figures.set_trim, trim)
+        context.run(default_overview, data_folder, store_folder)
+    entries = figures.figure_cache.items()
+    figures.write_figure_snapshot(snapshot_path(store_folder), entries,
+                                  sources=data_sources(data_folder))
+    return len(entries)
+
+
+def snapshot_current(data_folder=None, store_folder=None):
+    """Whether the snapshot exists and was written for the current files."""
+    path = snapshot_path(store_folder)
+    if not os.path.exists(path):
+        return False
+    extra, _ = figures.read_figure_snapshot(path)
+    return extra.get("sources") == data_sources(data_folder)
+
+
+def load_snapshot(data_folder=None, store_folder=None):
+    """Seed the figure cache from the snapshot if it was written for the current files; returns the count."""
+    path = snapshot_path(store_folder)
+    if not os.path.exists(path):
+        return 0
+    extra, entries = figures.read_figure_snapshot(path)
+    if extra.get("sources") != data_sources(data_folder):
+        return 0
+    for key, spec_json in entries:
+        figures.figure_cache.put(key, spec_json)
+    return len(entries)
+
+
+def prewarm(data_folder=None, store_folder=None):
+    """Load what the tabs share and build the default view; run in a background thread."""
+    try:
+        default_overview(data_folder, store_folder)
+        load_monthly(data_folder, store_folder)
+        import plotly.express  # noqa: F401 – the first figure built on a cache miss needs it
+    except Exception:
+        # The page reports the same error when it gets there
+        traceback.print_exc()
+
+
+def start(data_folder=None, store_folder=None, prewarm_in_background=PREWARM):
+    """Once per process: seed the figure cache from the snapshot and start the warm-up thread."""
+    key = (data_folder or DATA_FOLDER, store_folder or STORE_FOLDER)
+    with _start_lock:
+        if key in _started:
+            return
+        _started.add(key)
+    try:
+        load_snapshot(data_folder, store_folder)
+    except (OSError, ValueError):
+        traceback.print_exc()
+    if prewarm_in_background:
+        threading.Thread(target=prewarm, args=(data_folder, store_folder), name="smac-prewarm", daemon=True).start()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write the default view's figure snapshot.")
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    parser.add_argument("--store-folder", default=STORE_FOLDER)
+    args = parser.parse_args()
+    count = write_snapshot(args.data_folder, args.store_folder)
+    print(f"Snapshot: {count} figures -> {snapshot_path(args.store_folder)}")
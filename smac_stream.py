@@ -0,0 +1,276 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – streaming aggregation
+# ==============================================
+# Out-of-core path for country-year files too large to load whole (source-level
+# inventories run to gigabytes per file). A file is read in chunks sized to a
+# memory ceiling – record batches from the store, or CSV chunks – each chunk is
+# filtered by gas as it is read, grouped, and folded into running group sums.
+# Peak memory is one chunk plus the accumulated groups, whatever the file size.
+#
+#   SMAC_STREAM_MEMORY_MB      memory ceiling for one streamed file (default 256)
+#   SMAC_STREAM_THRESHOLD_MB   files larger than this are streamed by the
+#                              artifact builds and ingest (default 512)
+#
+#   python smac_stream.py --memory-mb 1   # check every file against the in-memory path
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from smac_perf import timed
+from smac_data import (FLOAT32_EMISSIONS, STORE_SCHEMA, TIME_FORMAT, compact_frame, country_year_path,
+                       store_is_fresh, store_path, store_schema)
+
+STREAM_MEMORY_MB = float(os.environ.get("SMAC_STREAM_MEMORY_MB", "256"))
+STREAM_THRESHOLD_MB = float(os.environ.get("SMAC_STREAM_THRESHOLD_MB", "512"))
+# Of the ceiling: one chunk (CSV parsing briefly holds it twice) and the running sums
+CHUNK_SHARE = 0.25
+ACCUMULATOR_SHARE = 0.5
+SAMPLE_ROWS = 10_000
+MIN_CHUNK_ROWS = 1_000
+
+
+def should_stream(country_code, year, folder=None, store_folder=None, threshold_mb=STREAM_THRESHOLD_MB):
+    """True when the country-year CSV is larger than `threshold_mb`."""
+    csv_path = country_year_path(country_code, year, folder)
+    return os.path.exists(csv_path) and os.path.getsize(csv_path) > threshold_mb * 1024 ** 2
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _chunk_rows(sample, memory_mb):
+    # Rows per chunk from the in-memory size of a sample read the same way
+    if sample.empty:
+        return MIN_CHUNK_ROWS
+    bytes_per_row = _frame_bytes(sample) / len(sample)
+    return max(MIN_CHUNK_ROWS, int(memory_mb * 1024 ** 2 * CHUNK_SHARE / bytes_per_row))
+
+
+# ----------------------------------------------
+# Chunked readers
+# ----------------------------------------------
+
+def iter_country_year(country_code, year, columns=None, gas=None, folder=None, store_folder=None,
+                      memory_mb=STREAM_MEMORY_MB, float32=FLOAT32_EMISSIONS):
+    """Yield one country-year in bounded chunks, in the compact schema of read_country_year.
+
+    From the store only the requested columns and the row groups of `gas` are
+    read; from the CSV rows of other gases are dropped from each chunk before
+    dates and categoricals are parsed. Raises FileNotFoundError if neither exists.
+    """
+    csv_path = country_year_path(country_code, year, folder)
+    parquet_path = store_path(country_code, year, store_folder)
+    if store_is_fresh(csv_path, parquet_path):
+        return _iter_store(parquet_path, columns, gas, memory_mb, float32)
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+    return _iter_csv(csv_path, columns, gas, memory_mb, float32)
+
+
+def _iter_store(path, columns, gas, memory_mb, float32):
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + (["gas"] if gas is not None else [])))
+    dataset = ds.dataset(path, format="parquet")
+    sample = next(dataset.to_batches(columns=columns, batch_size=SAMPLE_ROWS), None)
+    rows = _chunk_rows(sample.to_pandas() if sample is not None else pd.DataFrame(), memory_mb)
+    batches = dataset.to_batches(columns=columns, filter=ds.field("gas") == gas if gas is not None else None,
+                                 batch_size=rows, batch_readahead=0, fragment_readahead=0)
+    # Batches stop at row group boundaries; coalesce small ones up to the chunk size
+    pending, pending_rows = [], 0
+    for batch in batches:
+        if batch.num_rows:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+        if pending_rows >= rows:
+            yield compact_frame(pa.Table.from_batches(pending).to_pandas(), float32)
+            pending, pending_rows = [], 0
+    if pending:
+        yield compact_frame(pa.Table.from_batches(pending).to_pandas(), float32)
+
+
+def _iter_csv(path, columns, gas, memory_mb, float32):
+    usecols = None
+    if columns is not None:
+        wanted = set(columns) | ({"gas"} if gas is not None else set())
+        usecols = lambda column: column in wanted
+    rows = _chunk_rows(pd.read_csv(path, usecols=usecols, nrows=SAMPLE_ROWS), memory_mb)
+    with pd.read_csv(path, usecols=usecols, chunksize=rows) as reader:
+        for chunk in reader:
+            if gas is not None:
+                chunk = chunk[chunk["gas"] == gas]
+            if not chunk.empty:
+                yield compact_frame(chunk, float32)
+
+
+# ----------------------------------------------
+# Running group sums
+# ----------------------------------------------
+
+class GroupSum:
+    """Running sum of per-chunk group sums.
+
+    add() takes a Series indexed by the group keys (a chunk's groupby().sum());
+    once the pending parts exceed `max_bytes` they are folded into one by
+    re-grouping, so memory stays bounded by the number of distinct groups.
+    """
+
+    def __init__(self, max_bytes, dropna=True):
+        self.max_bytes = max_bytes
+        self.dropna = dropna
+        self._parts = []
+        self._bytes = 0
+        self.chunks = 0
+        self.folds = 0
+
+    def add(self, sums):
+        self._parts.append(sums)
+        self._bytes += int(sums.memory_usage(deep=True))
+        self.chunks += 1
+        if self._bytes > self.max_bytes and len(self._parts) > 1:
+            self._fold()
+
+    def _fold(self):
+        combined = pd.concat(self._parts)
+        levels = list(range(combined.index.nlevels))
+        folded = combined.groupby(level=levels, observed=True, dropna=self.dropna).sum()
+        self._parts = [folded]
+        self._bytes = int(folded.memory_usage(deep=True))
+        self.folds += 1
+
+    def result(self):
+        """The folded sums, sorted by key like a single groupby; None if nothing was added."""
+        if not self._parts:
+            return None
+        self._fold()
+        return self._parts[0]
+
+
+def _accumulator_bytes(memory_mb, accumulators=1):
+    return int(memory_mb * 1024 ** 2 * ACCUMULATOR_SHARE / accumulators)
+
+
+def stream_groupby_sum(country_code, year, by, values="total_emission", gas=None, folder=None,
+                       store_folder=None, memory_mb=STREAM_MEMORY_MB, float32=FLOAT32_EMISSIONS):
+    """Streamed read_country_year(...).groupby(by, observed=True)[values].sum(), within `memory_mb`."""
+    keys = [by] if isinstance(by, str) else list(by)
+    columns = list(dict.fromkeys(keys + [values]))
+    totals = GroupSum(_accumulator_bytes(memory_mb))
+    with timed("stream", f"{country_code} {year}"):
+        for chunk in iter_country_year(country_code, year, columns, gas, folder, store_folder, memory_mb, float32):
+            totals.add(chunk.groupby(by, observed=True)[values].sum())
+    result = totals.result()
+    if result is None:
+        return pd.Series(dtype="float32" if float32 else "float64", name=values)
+    return result
+
+
+def stream_partials(partials, country_code, year, columns, folder=None, store_folder=None,
+                    memory_mb=STREAM_MEMORY_MB):
+    """{name: partial frame} of one file streamed once through every `partials` entry.
+
+    `partials` maps name -> (keys, fn), fn rolling a frame up to keys +
+    total_emission; sums are additive, so rolling up each chunk and folding the
+    results gives the rows fn would return for the whole file.
+    """
+    totals = {name: GroupSum(_accumulator_bytes(memory_mb, len(partials)), dropna=False) for name in partials}
+    with timed("stream", f"{country_code} {year}"):
+        for chunk in iter_country_year(country_code, year, columns, None, folder, store_folder, memory_mb):
+            for name, (keys, fn) in partials.items():
+                totals[name].add(fn(chunk, country_code, year).set_index(keys)["total_emission"])
+    result = {}
+    for name, (keys, _) in partials.items():
+        sums = totals[name].result()
+        result[name] = (sums.reset_index() if sums is not None
+                        else pd.DataFrame(columns=keys + ["total_emission"]))
+    return result
+
+
+# ----------------------------------------------
+# Chunked store conversion
+# ----------------------------------------------
+
+def convert_csv_to_store_chunked(csv_path, parquet_path, memory_mb=STREAM_MEMORY_MB):
+    """convert_csv_to_store for files larger than memory: one row group per gas per chunk.
+
+    Rows are sorted within each chunk only; every row group still holds a single
+    gas, so gas-filtered reads skip the others by their statistics.
+    """
+    schema = store_schema(csv_path)
+    rows = _chunk_rows(pd.read_csv(csv_path, nrows=SAMPLE_ROWS), memory_mb)
+    os.makedirs(os.path.dirname(parquet_path) or ".", exist_ok=True)
+    tmp_path = parquet_path + ".tmp"
+    total = 0
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer, \
+            pd.read_csv(csv_path, chunksize=rows) as reader:
+        for chunk in reader:
+            for col in ("start_time", "end_time"):
+                chunk[col] = pd.to_datetime(chunk[col], format=TIME_FORMAT, utc=True)
+            chunk = chunk.sort_values(["gas", "original_inventory_sector", "location", "start_time"], kind="stable")
+            for _, gas_df in chunk.groupby("gas", sort=True):
+                writer.write_table(pa.Table.from_pandas(gas_df, schema=STORE_SCHEMA, preserve_index=False))
+            total += len(chunk)
+    os.replace(tmp_path, parquet_path)
+    return total
+
+
+# ----------------------------------------------
+# Check against the in-memory path
+# ----------------------------------------------
+
+def compare_sums(streamed, in_memory, rtol=1e-9):
+    """Largest relative difference between two group sums; raises AssertionError if keys differ.
+
+    Keys are compared as text (chunks may leave categoricals as object) and sums
+    to `rtol`, since adding per-chunk subtotals rounds differently from one pass.
+    """
+    def plain(sums):
+        sums = sums.reset_index()
+        keys = list(sums.columns[:-1])
+        sums[keys] = sums[keys].astype(str)
+        return sums.sort_values(keys, ignore_index=True)
+
+    streamed, in_memory = plain(streamed), plain(in_memory)
+    pd.testing.assert_frame_equal(streamed, in_memory, check_exact=False, rtol=rtol,
+                                  check_dtype=False, check_column_type=False)
+    values = in_memory.columns[-1]
+    scale = in_memory[values].abs().where(lambda v: v > 0, 1)
+    return float(((streamed[values] - in_memory[values]).abs() / scale).max() if len(in_memory) else 0.0)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import smac_aggregates
+    from smac_data import DATA_FOLDER, STORE_FOLDER, discover_csv_files, read_country_year
+
+    parser = argparse.ArgumentParser(description="Check streamed aggregation against the in-memory path.")
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    parser.add_argument("--store-folder", default=STORE_FOLDER)
+    parser.add_argument("--memory-mb", type=float, default=1.0, help="ceiling small enough to force many chunks")
+    args = parser.parse_args()
+
+    artifacts = {name: (keys, fn) for name, (_, keys, _, fn) in smac_aggregates.ARTIFACTS.items()}
+    columns = sorted({c for _, _, source, _ in smac_aggregates.ARTIFACTS.values() for c in source})
+    checks = [("gas", "original_inventory_sector"), ("original_inventory_sector", "location")]
+    for country_code, year, _ in discover_csv_files(args.data_folder):
+        folders = dict(folder=args.data_folder, store_folder=args.store_folder)
+        df = read_country_year(country_code, year, columns=columns, **folders)
+        diffs = []
+        for by in checks:
+            for gas in (None, "ch4"):
+                rows = df if gas is None else df[df["gas"] == gas]
+                in_memory = rows.groupby(list(by), observed=True)["total_emission"].sum()
+                streamed = stream_groupby_sum(country_code, year, list(by), gas=gas, memory_mb=args.memory_mb, **folders)
+                diffs.append(compare_sums(streamed, in_memory))
+        streamed = stream_partials(artifacts, country_code, year, columns, memory_mb=args.memory_mb, **folders)
+        for name, (keys, fn) in artifacts.items():
+            in_memory = fn(df, country_code, year).set_index(keys)["total_emission"]
+            diffs.append(compare_sums(streamed[name].set_index(keys)["total_emission"], in_memory))
+        chunks = sum(1 for _ in iter_country_year(country_code, year, columns, memory_mb=args.memory_mb, **folders))
+        print(f"{country_code} {year}: {len(diffs)} checks match over {chunks} chunks "
+              f"(max relative difference {max(diffs):.1e})")
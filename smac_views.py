@@ -0,0 +1,412 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – views
+# ==============================================
+# Data and figure builders behind each tab. They take the gas pivot of the
+# emissions cube (one column per gas) and plain parameters, never touch
+# Streamlit, and so can run headless (benchmark.py). Picking a gas is a column
+# lookup on the pivot; figures are served from the serialized figure cache
+# (smac_figures) when their data slice and options repeat, so plotly.express is
+# only imported by the first figure that has to be built.
+#
+#   SMAC_VIEW_MEMO_ENTRIES   memoized view results kept per process (default 256)
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from smac_aggregates import cube_slice, cube_sum, resample_rollup
+from smac_data import GAS_LABELS, GWP_100, GWP_20, country_name_map
+from smac_figures import cached_figure
+from smac_perf import instrument, timed
+
+VIEW_MEMO_ENTRIES = int(os.environ.get("SMAC_VIEW_MEMO_ENTRIES", "256"))
+
+country_centroids = {
+    "ARG": {"Country": "Argentina", "Lat": -38.4, "Lon": -63.6},
+    "BRA": {"Country": "Brazil", "Lat": -14.2, "Lon": -51.9},
+    "CAN": {"Country": "Canada", "Lat": 56.1, "Lon": -106.3},
+    "DEU": {"Country": "Germany", "Lat": 51.2, "Lon": 10.5},
+    "ESP": {"Country": "Spain", "Lat": 40.5, "Lon": -3.7},
+    "IND": {"Country": "India", "Lat": 21.1, "Lon": 78.0},
+    "KOR": {"Country": "South Korea", "Lat": 36.5, "Lon": 127.9},
+    "MEX": {"Country": "Mexico", "Lat": 23.6, "Lon": -102.5},
+    "NGA": {"Country": "Nigeria", "Lat": 9.1, "Lon": 8.7},
+    "USA": {"Country": "United States", "Lat": 37.1, "Lon": -95.7},
+    "ZAF": {"Country": "South Africa", "Lat": -30.6, "Lon": 22.9},
+}
+
+
+# ----------------------------------------------
+# Memoized views
+# ----------------------------------------------
+
+class ViewMemo:
+    """Process-wide LRU of view results built from one pivot.
+
+    Results are shared by every session and panel, so callers must not mutate
+    them. A different pivot (the cube was reloaded) empties the memo.
+    """
+
+    def __init__(self, max_entries=VIEW_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._source = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source, key, build):
+        """The memoized result for `key`, calling build() on a miss."""
+        with self._lock:
+            if source is not self._source:
+                self._entries.clear()
+                self._source = source
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = build()
+        with self._lock:
+            if source is self._source:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._source = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+view_memo = ViewMemo()
+
+
+# ----------------------------------------------
+# Data: gases
+# ----------------------------------------------
+
+def emission_label(gas):
+    return f"{GAS_LABELS[gas]} Emissions"
+
+
+def gas_sum(pivot, by, gas='ch4', **filters):
+    """One gas's column summed by `by`, returned as total_emission."""
+    totals = cube_sum(pivot, by, values=gas, **filters)
+    # Relabel in place: cheaper than rename() and the frame is ours
+    totals.columns = [*totals.columns[:-1], 'total_emission']
+    return totals
+
+
+def ch4_share(pivot, horizon='100yr', **filters):
+    """CH₄'s share of CO₂e (`horizon` GWP) in a pivot slice, or None without co2e rows."""
+    co2e = f'co2e_{horizon}'
+    if co2e not in pivot.columns:
+        return None
+    rows = cube_slice(pivot, **filters)
+    total = rows[co2e].sum()
+    if not total:
+        return None
+    gwp = (GWP_100 if horizon == '100yr' else GWP_20)['ch4']
+    return float(rows['ch4'].sum() * gwp / total)
+
+
+# ----------------------------------------------
+# Data: Tab 1 – SMAC Group Overview
+# ----------------------------------------------
+
+def country_totals(pivot, countries, year, gas='ch4'):
+    """One gas per country for one year, ranked, with full names and map centroids."""
+    country_emissions = (
+        gas_sum(pivot, 'country', gas, country=countries, year=year)
+        .sort_values(by='total_emission', ascending=False)
+    )
+    country_emissions['Country Full Name'] = country_emissions['country'].map(country_name_map)
+    country_emissions["Lat"] = country_emissions["country"].apply(lambda x: country_centroids[x]["Lat"])
+    country_emissions["Lon"] = country_emissions["country"].apply(lambda x: country_centroids[x]["Lon"])
+    return country_emissions
+
+
+def country_ranking(country_emissions, gas='ch4'):
+    ranking = country_emissions.copy()
+    ranking['Rank'] = range(1, len(ranking) + 1)
+    ranking = ranking[['Rank', 'Country Full Name', 'total_emission']]
+    ranking.columns = ['Rank', 'Country', emission_label(gas)]
+    return ranking
+
+
+def top_locations_group(top_index, countries, year, n=10, gas='ch4', sector=None):
+    """Top n locations across countries, merged from each country's top n (see TopLocations)."""
+    top = top_index.ranking(countries, year, n, gas, sector)
+    top['Country Full Name'] = top['country'].map(country_name_map)
+    return top
+
+
+# ----------------------------------------------
+# Data: Tab 2 / Comparison Tool – one country
+# ----------------------------------------------
+
+def sector_trend(pivot, countries, years, gas='ch4'):
+    """One gas per (year, sector) for one or more countries."""
+    return gas_sum(pivot, ['year', 'sector'], gas, country=countries, year=years)
+
+
+def subsector_totals(pivot, country_code, year, gas='ch4'):
+    """One gas per original_inventory_sector with its mapped sector."""
+    totals = gas_sum(pivot, ['original_inventory_sector', 'sector'], gas, country=country_code, year=year)
+    return totals[['original_inventory_sector', 'total_emission', 'sector']]
+
+
+def sector_totals(subsector_df):
+    with timed("groupby", "sector"):
+        return subsector_df.groupby('sector')['total_emission'].sum().reset_index()
+
+
+def _country_year_tables(pivot, country_code, year, gas):
+    subsectors = subsector_totals(pivot, country_code, year, gas)
+    return subsectors, sector_totals(subsectors)
+
+
+def comparison_summary(pivot, country_code, year, years, gas='ch4'):
+    """(subsector table, sector table, trend) of one comparison panel, memoized.
+
+    The tables are keyed on (country, year, gas) and the trend on (country,
+    years, gas), so changing only a panel's year reuses its trend, and panels
+    with the same selection share one computation.
+    """
+    subsectors, sectors = view_memo.get(pivot, ('country year', country_code, year, gas),
+                                        lambda: _country_year_tables(pivot, country_code, year, gas))
+    trend = view_memo.get(pivot, ('trend', country_code, tuple(years), gas),
+                          lambda: sector_trend(pivot, country_code, years, gas))
+    return subsectors, sectors, trend
+
+
+def top_locations_table(top_index, country_code, year, n=10, gas='ch4', sector=None):
+    top_locations = top_index.ranking(country_code, year, n, gas, sector)
+    top_locations['Rank'] = top_locations.index + 1
+    top_locations[emission_label(gas)] = top_locations['total_emission'].apply(lambda x: f"{x:.3f}")
+    return top_locations[['Rank', 'location', emission_label(gas)]]
+
+
+# ----------------------------------------------
+# Data: Monthly Trends – monthly rollup
+# ----------------------------------------------
+
+def monthly_options(monthly, country_code, gas='ch4'):
+    """Sectors and locations with rows of `gas` for a country, for the explorer's selectors."""
+    rows = cube_slice(monthly, country=country_code, gas=gas)
+    sectors = sorted(rows['sector'].astype(str).unique())
+    locations = sorted(rows['location'].astype(str).unique())
+    return sectors, locations
+
+
+def monthly_trend(monthly, country_code, sector=None, location=None, freq="M", split_by=None, gas='ch4'):
+    """One gas per month (or quarter/year start) from the rollup, optionally split by sector or location."""
+    by = ['month'] + ([split_by] if split_by else [])
+    totals = cube_sum(monthly, by, country=country_code, sector=sector, location=location, gas=gas)
+    return resample_rollup(totals, freq, by=by[1:])
+
+
+# ----------------------------------------------
+# Data: Changes & anomalies
+# ----------------------------------------------
+
+def year_movers(changes, year, gas='ch4', countries=None, sector=None, n=20):
+    """The n biggest year-over-year movers into `year`, with full country names and a bar label."""
+    movers = changes.movers(year, gas, countries, sector, n)
+    movers['Country Full Name'] = movers['country'].map(country_name_map)
+    movers['series'] = movers['location'] + ' – ' + movers['sector']
+    return movers
+
+
+def pct_labels(change_pct):
+    """Percent changes as '+12.3%' text, 'n/a' where there is no base to compare with."""
+    return [f"{pct:+.1f}%" if pd.notna(pct) else "n/a" for pct in change_pct]
+
+
+def movers_table(movers, year, previous_year, gas='ch4'):
+    table = movers.assign(change_pct=pct_labels(movers['change_pct']))
+    table = table[['Country Full Name', 'sector', 'location', 'previous', 'total_emission', 'change', 'change_pct']]
+    table.columns = ['Country', 'Sector', 'Location', f'{emission_label(gas)} {previous_year}',
+                     f'{emission_label(gas)} {year}', 'Change', 'Change (%)']
+    return table
+
+
+def anomalies_table(anomalies):
+    table = anomalies.assign(country=anomalies['country'].map(country_name_map))
+    table = table[['country', 'sector', 'location', 'month', 'total_emission', 'expected', 'z']]
+    table.columns = ['Country', 'Sector', 'Location', 'Month', 'Emissions', 'Same month, mean of years', 'z-score']
+    return table
+
+
+# ----------------------------------------------
+# Figures
+# ----------------------------------------------
+
+@instrument("figure")
+@cached_figure
+def fig_country_map(country_emissions, year, gas='ch4'):
+    import plotly.express as px
+
+    fig = px.scatter_mapbox(
+        country_emissions,
+        lat="Lat",
+        lon="Lon",
+        size="total_emission",
+        color="total_emission",
+        hover_name="Country Full Name",
+        size_max=50,
+        zoom=1,
+        color_continuous_scale=px.colors.sequential.Viridis,
+        labels={'total_emission': emission_label(gas)},
+        title=f"{emission_label(gas)} by Country ({year})"
+    )
+    fig.update_traces(
+        hovertemplate=
+    "<b>%{hovertext}</b><br>" +
+    f"{emission_label(gas)}: %{{marker.size:.2f}}<br>" +
+    "Lat: %{lat}<br>" +
+    "Lon: %{lon}<extra></extra>")
+
+    fig.update_layout(
+        mapbox_style="carto-positron",
+        margin={"r":0, "t":30, "l":0, "b":0}
+    )
+    return fig
+
+
+@instrument("figure")
+@cached_figure
+def fig_sector_trend(sector_time_df, title, gas='ch4'):
+    import plotly.express as px
+
+    return px.bar(
+        sector_time_df,
+        x='year',
+        y='total_emission',
+        color='sector',
+        labels={'total_emission': emission_label(gas), 'year': 'Year'},
+        title=title
+    )
+
+
+@instrument("figure")
+@cached_figure
+def fig_country_pie(country_emissions, year, gas='ch4'):
+    import plotly.express as px
+
+    return px.pie(
+        country_emissions,
+        names='Country Full Name',
+        values='total_emission',
+        title=f"Country Share of Total {emission_label(gas)} ({year})"
+    )
+
+
+@instrument("figure")
+@cached_figure
+def fig_top_locations(top_locations, year, gas='ch4', n=10):
+    import plotly.express as px
+
+    return px.bar(
+        top_locations,
+        x='location',
+        y='total_emission',
+        color='Country Full Name',
+        title=f"Top {n} Emitting Locations ({year})",
+        labels={'total_emission': emission_label(gas), 'location': 'Location'}
+    )
+
+
+@instrument("figure")
+@cached_figure
+def fig_sector_bar(sector_df, title, labels=None):
+    import plotly.express as px
+
+    return px.bar(
+        sector_df.sort_values(by='total_emission', ascending=False),
+        x='sector',
+        y='total_emission',
+        labels=labels,
+        title=title
+    )
+
+
+@instrument("figure")
+@cached_figure
+def fig_subsector_pie(subsector_df, title):
+    import plotly.express as px
+
+    fig = px.pie(subsector_df, names='original_inventory_sector', values='total_emission', title=title)
+    fig.update_traces(
+        textinfo='none',
+        pull=[0.05]*len(subsector_df),
+        insidetextorientation='radial'
+    )
+    fig.update_layout(
+        uniformtext_minsize=10,
+        uniformtext_mode='hide',
+        legend=dict(font=dict(size=10)),
+        showlegend=True
+    )
+    return fig
+
+
+@instrument("figure")
+@cached_figure
+def fig_monthly_trend(trend_df, title, split_by=None, gas='ch4'):
+    import plotly.express as px
+
+    return px.line(
+        trend_df,
+        x='month',
+        y='total_emission',
+        color=split_by,
+        markers=True,
+        labels={'total_emission': emission_label(gas), 'month': 'Period', 'sector': 'Sector', 'location': 'Location'},
+        title=title
+    )
+
+
+@instrument("figure")
+@cached_figure
+def fig_year_movers(movers, year, previous_year, gas='ch4'):
+    import plotly.express as px
+
+    return px.bar(
+        movers.assign(change_pct=pct_labels(movers['change_pct'])),
+        x='series',
+        y='change',
+        color='Country Full Name',
+        hover_data={'previous': ':.3f', 'total_emission': ':.3f', 'change_pct': True},
+        labels={'change': f'Change in {emission_label(gas)}', 'series': 'Location – Sector',
+                'previous': str(previous_year), 'total_emission': str(year), 'change_pct': 'Change (%)'},
+        title=f"Biggest Changes in {emission_label(gas)}, {previous_year} → {year}"
+    )
+
+
+def comparison_figures(pivot, country_code, year, years, gas='ch4'):
+    """(sector bar, subsector pie, trend) figures of one comparison panel.
+
+    Built from the memoized panel data, so repeated panels hit the figure cache.
+    """
+    subsectors, _, trend = comparison_summary(pivot, country_code, year, years, gas)
+    name, label = country_name_map[country_code], emission_label(gas)
+    return (
+        fig_sector_bar(subsectors, f"{name} – {label} by Sector"),
+        fig_subsector_pie(subsectors, f"{name} – {label} by Subsector"),
+        fig_sector_trend(trend, f"{name} {label} by Sector ({min(years)}–{max(years)})", gas),
+    )
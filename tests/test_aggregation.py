@@ -0,0 +1,232 @@
+# ==============================================
+# SMAC-Members-Inventory-Dashboard – aggregation tests
+# ==============================================
+# The hand-rolled group sums (ArrayFrame's mixed-radix bincount, the streamed
+# GroupSum folds and the per-file artifact updates) checked against a plain
+# pandas groupby().sum() of the same rows.
+#
+#   python -m pytest -q
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import smac_arrays
+from smac_aggregates import ARTIFACTS, PIVOT_KEYS, combine_partials, replace_file_rows
+from smac_arrays import ArrayFrame, write_arrays
+from smac_data import map_sector, month_start
+from smac_stream import GroupSum
+
+COUNTRIES = ["ARG", "BRA", "CHL", "ZAF"]
+YEARS = [2021, 2022, 2023]
+SUBSECTORS = ["electricity-generation", "cement", "solid-fuel-transformation", "not-a-subsector"]
+LOCATIONS = [f"site-{i:02d}" for i in range(12)]
+GASES = ["ch4", "co2", "n2o"]
+
+
+def normalized(df, keys):
+    """`df` with text keys as plain strings, sorted by `keys` and re-indexed, for comparison."""
+    df = df.copy()
+    for key in keys:
+        if isinstance(df[key].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[key]):
+            df[key] = df[key].astype(object).where(df[key].notna(), None)
+        elif key != "month":
+            df[key] = df[key].astype(np.int64)
+    return df.sort_values(keys, ignore_index=True, na_position="last")
+
+
+def assert_sums_equal(result, expected, keys, values):
+    result, expected = normalized(result, keys), normalized(expected, keys)
+    assert len(result) == len(expected)
+    pd.testing.assert_frame_equal(result[keys], expected[keys], check_dtype=False, check_categorical=False)
+    np.testing.assert_allclose(result[values].to_numpy(np.float64), expected[values].to_numpy(np.float64),
+                               rtol=1e-12)
+
+
+# ----------------------------------------------
+# Fixtures
+# ----------------------------------------------
+
+def country_year_rows(country_code, year, seed, locations=LOCATIONS):
+    """Monthly rows of one country-year file as read_country_year returns them (some combinations absent)."""
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product([range(1, 13), GASES, SUBSECTORS, locations],
+                                       names=["month", "gas", "original_inventory_sector", "location"])
+    rows = index.to_frame(index=False).sample(frac=0.6, random_state=seed).reset_index(drop=True)
+    rows["start_time"] = pd.to_datetime({"year": year, "month": rows.pop("month"), "day": 1})
+    rows["total_emission"] = rng.gamma(1.5, 100.0, len(rows))
+    for column in ("gas", "original_inventory_sector", "location"):
+        rows[column] = rows[column].astype("category")
+    return rows[["start_time", "gas", "original_inventory_sector", "location", "total_emission"]]
+
+
+@pytest.fixture
+def files():
+    """{(country, year): rows} with one country missing a year, so not every pair exists."""
+    return {
+        (country_code, year): country_year_rows(country_code, year, seed=i)
+        for i, (country_code, year) in enumerate((c, y) for c in COUNTRIES for y in YEARS)
+        if (country_code, year) != ("CHL", 2022)
+    }
+
+
+def expected_artifact(files, name):
+    """Artifact `name` of `files` computed in one plain pandas groupby over all their rows."""
+    keys = ARTIFACTS[name][1]
+    rows = pd.concat([
+        df.astype({"gas": str, "original_inventory_sector": str, "location": str})
+        .assign(country=country_code, year=year)
+        for (country_code, year), df in files.items()
+    ], ignore_index=True)
+    rows["sector"] = map_sector(rows["original_inventory_sector"])
+    rows["month"] = month_start(rows["start_time"])
+    return rows.groupby(keys)["total_emission"].sum().reset_index()
+
+
+def build(files, name):
+    fn = ARTIFACTS[name][3]
+    return combine_partials([fn(df, c, y) for (c, y), df in files.items()], ARTIFACTS[name][1])
+
+
+@pytest.fixture
+def pivot(files):
+    """A gas pivot with categorical keys: unused categories, a missing location, and gaps."""
+    cube = build(files, "cube")
+    pivot = (cube.set_index(PIVOT_KEYS + ["gas"])["total_emission"]
+             .unstack("gas", fill_value=0.0).reset_index())
+    pivot.columns = list(pivot.columns)
+    pivot["country"] = pivot["country"].cat.add_categories(["GHA", "NGA"])
+    pivot["location"] = pivot["location"].cat.add_categories(["unused-site"])
+    pivot.loc[pivot.index[::17], "location"] = np.nan
+    return pivot
+
+
+# ----------------------------------------------
+# ArrayFrame.group_sum
+# ----------------------------------------------
+
+GROUPINGS = [
+    ["country"],
+    ["year"],
+    ["country", "year"],
+    ["country", "year", "sector"],
+    ["sector", "location"],
+    ["country", "year", "sector", "original_inventory_sector", "location"],
+]
+FILTERS = [
+    {},
+    {"country": "BRA"},
+    {"country": ["ARG", "ZAF", "GHA"], "year": 2022},
+    {"year": [2021, 2023], "sector": "power"},
+    {"country": "NGA"},      # a category with no rows
+    {"country": "XYZ"},      # not in the dictionary at all
+]
+
+
+@pytest.mark.parametrize("dense", [True, False], ids=["bincount", "unique"])
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda f: ",".join(f) or "all")
+@pytest.mark.parametrize("by", GROUPINGS, ids="-".join)
+def test_array_group_sum_matches_groupby(pivot, tmp_path, monkeypatch, by, filters, dense):
+    values = [gas for gas in GASES if gas in pivot.columns]
+    folder = str(tmp_path / "pivot")
+    write_arrays(pivot, folder, PIVOT_KEYS, values, sources={})
+    # 0 leaves the dense path only when the key space is at most twice the rows
+    monkeypatch.setattr(smac_arrays, "DENSE_GROUPS", smac_arrays.DENSE_GROUPS if dense else 0)
+    table = ArrayFrame(folder)
+
+    result = table.group_sum(by, values, **filters)
+
+    rows = pivot
+    for column, value in filters.items():
+        rows = rows[rows[column].isin(value if isinstance(value, list) else [value])]
+    expected = rows.groupby(by, observed=True)[values].sum().reset_index()
+    assert_sums_equal(result, expected, by, values)
+
+
+def test_array_group_sum_no_keys(pivot, tmp_path):
+    folder = str(tmp_path / "pivot")
+    write_arrays(pivot, folder, PIVOT_KEYS, ["ch4"], sources={})
+    result = ArrayFrame(folder).group_sum([], "ch4", country="ZAF")
+    assert result["ch4"].tolist() == pytest.approx([pivot.loc[pivot["country"] == "ZAF", "ch4"].sum()])
+
+
+# ----------------------------------------------
+# smac_stream.GroupSum
+# ----------------------------------------------
+
+@pytest.mark.parametrize("dropna", [True, False])
+@pytest.mark.parametrize("chunks, max_bytes", [(1, 1 << 30), (7, 1 << 30), (7, 1)],
+                         ids=["one-chunk", "chunks", "chunks-folded"])
+def test_group_sum_matches_groupby(pivot, chunks, max_bytes, dropna):
+    keys = ["country", "year", "sector", "location"]
+    totals = GroupSum(max_bytes, dropna=dropna)
+    shuffled = pivot.sample(frac=1.0, random_state=0)
+    for rows in np.array_split(np.arange(len(shuffled)), chunks):
+        chunk = shuffled.iloc[rows]
+        totals.add(chunk.groupby(keys, observed=True, dropna=dropna)["ch4"].sum())
+    result = totals.result().reset_index()
+
+    expected = pivot.groupby(keys, observed=True, dropna=dropna)["ch4"].sum().reset_index()
+    assert totals.chunks == chunks
+    if max_bytes == 1 and chunks > 1:
+        assert totals.folds >= chunks - 1
+    assert_sums_equal(result, expected, keys, ["ch4"])
+
+
+def test_group_sum_empty():
+    assert GroupSum(1 << 20).result() is None
+
+
+# ----------------------------------------------
+# Per-file artifact updates (replace_file_rows)
+# ----------------------------------------------
+
+def partials_of(files):
+    return {name: [fn(df, c, y) for (c, y), df in files.items()]
+            for name, (_, _, _, fn) in ARTIFACTS.items()}
+
+
+@pytest.mark.parametrize("name", list(ARTIFACTS))
+def test_built_artifact_matches_groupby(files, name):
+    keys = ARTIFACTS[name][1]
+    assert_sums_equal(build(files, name), expected_artifact(files, name), keys, ["total_emission"])
+
+
+def test_replace_file_rows_add_revise_remove(files):
+    artifacts = {name: build(files, name) for name in ARTIFACTS}
+
+    # Add a file for a new country (with locations no other file has) and a year that
+    # only it has, revise one file and remove another
+    added = {("GHA", 2024): country_year_rows("GHA", 2024, seed=99, locations=["accra", "tema"])}
+    revised = {("BRA", 2022): country_year_rows("BRA", 2022, seed=100, locations=LOCATIONS[:5])}
+    removed = [("ZAF", 2021)]
+    changed = {**added, **revised}
+    file_names = [f"{c}_{y}.csv" for c, y in [*changed, *removed]]
+
+    updated = replace_file_rows(artifacts, file_names, partials_of(changed))
+
+    current = {pair: df for pair, df in files.items() if pair not in removed}
+    current.update(changed)
+    for name, (_, keys, _, _) in ARTIFACTS.items():
+        assert_sums_equal(updated[name], expected_artifact(current, name), keys, ["total_emission"])
+    assert not ((updated["cube"]["country"] == "ZAF") & (updated["cube"]["year"] == 2021)).any()
+    assert set(updated["cube"].loc[updated["cube"]["country"] == "BRA", "year"]) == set(YEARS)
+
+
+def test_replace_file_rows_remove_last_file(files):
+    only = {("ARG", 2021): files[("ARG", 2021)]}
+    artifacts = {name: build(only, name) for name in ARTIFACTS}
+    updated = replace_file_rows(artifacts, ["ARG_2021.csv"], {name: [] for name in ARTIFACTS})
+    for name, (_, keys, _, _) in ARTIFACTS.items():
+        assert updated[name].empty
+        assert list(updated[name].columns) == keys + ["total_emission"]
+
+
+def test_partials_cover_every_row(files):
+    """Summing the artifacts loses nothing: each gas total equals the raw rows' total."""
+    raw = pd.concat(files.values())
+    expected = raw.groupby("gas", observed=True)["total_emission"].sum()
+    for name in ARTIFACTS:
+        artifact = build(files, name)
+        totals = artifact.groupby("gas", observed=True)["total_emission"].sum()
+        np.testing.assert_allclose(totals.loc[expected.index].to_numpy(), expected.to_numpy(), rtol=1e-12)